@@ -0,0 +1,267 @@
+import os
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import argparse
+import re
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+from PyQt6.QtCore import Qt, QRect, QSize
+from PyQt6.QtGui import QGuiApplication, QImage, QImageWriter, QPainter
+from PyQt6.QtSql import QSqlDatabase, QSqlQuery
+from PyQt6.QtSvg import QSvgGenerator
+from image_io import allow_large_images
+from vector_log import StrokeLog
+
+CHUNK_SIZE = 32
+
+_app = None
+_db = None
+
+
+def parse_size(text):
+    if not text:
+        return None
+    match = re.fullmatch(r"(\d+)(?:x(\d+))?", text.strip().lower())
+    if not match:
+        raise argparse.ArgumentTypeError(f"invalid size: {text}")
+    width = int(match.group(1))
+    height = int(match.group(2) or width)
+    if width <= 0 or height <= 0:
+        raise argparse.ArgumentTypeError(f"invalid size: {text}")
+    return width, height
+
+
+def parse_count(text):
+    try:
+        count = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid count: {text}")
+    if count <= 0:
+        raise argparse.ArgumentTypeError(f"must be at least 1: {text}")
+    return count
+
+
+def open_database(path, name):
+    db = QSqlDatabase.addDatabase("QSQLITE", name)
+    db.setDatabaseName(path)
+    db.setConnectOptions("QSQLITE_OPEN_READONLY")
+    if not db.open():
+        raise RuntimeError(f"cannot open {path}: {db.lastError().text()}")
+    return db
+
+
+def select_art_ids(db, ids=None, artist=None):
+    if ids and not artist:
+        return list(ids)
+
+    query = QSqlQuery(db)
+    query.setForwardOnly(True)
+    if artist:
+        query.prepare("""
+            SELECT a.Artld FROM arts a
+            JOIN artists ar ON a.ArtistId = ar.ArtistId
+            WHERE ar.Name = ? ORDER BY a.Artld
+        """)
+        query.addBindValue(artist)
+    else:
+        query.prepare("SELECT Artld FROM arts ORDER BY Artld")
+
+    art_ids = []
+    if query.exec():
+        while query.next():
+            art_ids.append(query.value(0))
+
+    # Both filters together export the listed works that belong to the artist
+    if ids:
+        by_artist = set(art_ids)
+        return [art_id for art_id in ids if art_id in by_artist]
+    return art_ids
+
+
+def output_name(art_id, title, extension):
+    slug = re.sub(r"[^\w-]+", "_", title or "").strip("_")[:40]
+    return f"{art_id}-{slug}.{extension}" if slug else f"{art_id}.{extension}"
+
+
+def fit_size(width, height, size):
+    if size is None:
+        return width, height
+    scaled = QSize(width, height).scaled(size[0], size[1], Qt.AspectRatioMode.KeepAspectRatio)
+    return max(1, scaled.width()), max(1, scaled.height())
+
+
+def render_raster(pixmap_data, strokes, size):
+    image = QImage.fromData(pixmap_data) if pixmap_data else QImage()
+    log = StrokeLog.from_bytes(strokes)
+
+    if image.isNull():
+        if log is None:
+            return None
+        width, height = fit_size(log.width, log.height, size)
+        return log.render(width, height)
+
+    width, height = fit_size(image.width(), image.height(), size)
+    # Upscaling is re-rendered from the stroke log when one matches the picture
+    if log is not None and width > image.width() and log.width == image.width():
+        return log.render(width, height)
+    if (width, height) == (image.width(), image.height()):
+        return image
+    return image.scaled(width, height, Qt.AspectRatioMode.IgnoreAspectRatio,
+                        Qt.TransformationMode.SmoothTransformation)
+
+
+def write_svg(path, pixmap_data, strokes, size, title):
+    log = StrokeLog.from_bytes(strokes)
+    image = QImage.fromData(pixmap_data) if pixmap_data else QImage()
+    if log is None and image.isNull():
+        return False
+
+    source_width, source_height = (log.width, log.height) if log else (image.width(), image.height())
+    width, height = fit_size(source_width, source_height, size)
+
+    generator = QSvgGenerator()
+    generator.setFileName(path)
+    generator.setSize(QSize(width, height))
+    generator.setViewBox(QRect(0, 0, width, height))
+    generator.setTitle(title or "")
+
+    painter = QPainter(generator)
+    if log is not None:
+        log.paint(painter, width, height)
+    else:
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+        painter.drawImage(QRect(0, 0, width, height), image)
+    return painter.end()
+
+
+def init_worker(database_path):
+    global _app, _db
+    allow_large_images()
+    _app = QGuiApplication.instance() or QGuiApplication([])
+    _db = open_database(database_path, f"export-{os.getpid()}")
+
+
+def export_chunk(art_ids, output_dir, extension, size, quality):
+    results = []
+    query = QSqlQuery(_db)
+    query.prepare("SELECT Title, Pixmap, Strokes FROM arts WHERE Artld = ?")
+
+    for art_id in art_ids:
+        query.bindValue(0, art_id)
+        if not query.exec() or not query.next():
+            results.append((art_id, None, "not found"))
+            continue
+        title, pixmap_data, strokes = query.value(0), query.value(1), query.value(2)
+        query.finish()
+
+        path = os.path.join(output_dir, output_name(art_id, title, extension))
+        try:
+            if extension == "svg":
+                success = write_svg(path, pixmap_data, strokes, size, title)
+            else:
+                image = render_raster(pixmap_data, strokes, size)
+                success = image is not None and image.save(path, extension.upper(), quality)
+        except Exception as e:
+            results.append((art_id, None, str(e)))
+            continue
+
+        results.append((art_id, path, None) if success else (art_id, None, "render failed"))
+    return results
+
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def run_export(database_path, output_dir, art_ids, extension, size=None,
+               quality=-1, workers=None, chunk_size=CHUNK_SIZE):
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    chunks = chunked(art_ids, chunk_size)
+
+    # Workers are spawned, not forked, so no Qt state leaks into them
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"),
+                             initializer=init_worker, initargs=(database_path,)) as executor:
+        pending = set()
+        # A bounded number of chunks in flight keeps memory flat for any gallery size
+        for chunk in chunks:
+            pending.add(executor.submit(export_chunk, chunk, output_dir, extension, size, quality))
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+        for future in pending:
+            yield from future.result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="batch_export", description="Render gallery artworks to files without the GUI")
+    parser.add_argument("--database", default="arts.sqlite", help="path to arts.sqlite")
+    parser.add_argument("--output", default="export", help="output directory")
+    parser.add_argument("--ids", type=int, nargs="+", help="artwork IDs (default: all)")
+    parser.add_argument("--artist", help="only export works by this artist (combines with --ids)")
+    parser.add_argument("--size", type=parse_size, help="fit into WIDTH[xHEIGHT], keeping aspect ratio")
+    parser.add_argument("--format", default="png", help="png, jpg, webp, svg, ...")
+    parser.add_argument("--quality", type=int, default=-1, help="encoder quality 0-100")
+    parser.add_argument("--workers", type=parse_count, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--log", help="write progress to this file instead of the console")
+    args = parser.parse_args(argv)
+
+    allow_large_images()
+    app = QGuiApplication.instance() or QGuiApplication([])
+
+    extension = args.format.lower().lstrip(".")
+    supported = {bytes(fmt).decode() for fmt in QImageWriter.supportedImageFormats()}
+    if extension != "svg" and extension not in supported:
+        parser.error(f"unsupported format: {extension}")
+    if not os.path.exists(args.database):
+        parser.error(f"database not found: {args.database}")
+    try:
+        db = open_database(args.database, "export-main")
+    except RuntimeError as e:
+        parser.error(str(e))
+    art_ids = select_art_ids(db, args.ids, args.artist)
+    db.close()
+    del db
+    QSqlDatabase.removeDatabase("export-main")
+
+    # Windowed builds have no console, so sys.stdout and sys.stderr are None there
+    log = None
+    if args.log or sys.stdout is None or sys.stderr is None:
+        os.makedirs(args.output, exist_ok=True)
+        log = open(args.log or os.path.join(args.output, "export.log"), "a", encoding="utf-8")
+    out = log or sys.stdout
+    err = log or sys.stderr
+
+    try:
+        exported = failed = 0
+        for art_id, path, error in run_export(args.database, args.output, art_ids, extension,
+                                              args.size, args.quality, args.workers):
+            if error:
+                failed += 1
+                print(f"#{art_id}: {error}", file=err)
+            else:
+                exported += 1
+                print(path, file=out)
+
+        print(f"Exported {exported} of {len(art_ids)} artworks", file=err)
+    except BrokenProcessPool:
+        # A worker that cannot start (e.g. cannot open the database) breaks the whole pool
+        print(f"Export aborted after {exported} of {len(art_ids)} artworks: "
+              "a worker process failed", file=err)
+        return 1
+    finally:
+        if log is not None:
+            log.close()
+        app.quit()
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,14 +2,84 @@ from PyQt6.QtWidgets import *
 from PyQt6.QtSql import *
 from PyQt6.QtCore import *
 from PyQt6.QtGui import *
+from image_hash import (DUPLICATE_DISTANCE, HASH_PREFIX, SIMILAR_DISTANCE, MultiIndexHash,
+                        decode_hash_source, dhash, hash_image_data, hash_to_text, hash_from_text)
+from image_io import image_size, read_preview
+from revisions import (apply_tiles, blank_image, decode_tiles, encode_tiles,
+                       normalize_image, resize_image)
+
+HASH_BACKFILL_BATCH = 50
+STALE_HASH = f"(PHash IS NULL OR substr(PHash, 1, {len(HASH_PREFIX)}) != '{HASH_PREFIX}')"
+
+
+class HashBackfillSignals(QObject):
+    hashed = pyqtSignal(list)
+
+
+class HashBackfillTask(QRunnable):
+    def __init__(self, database_path, art_ids):
+        super().__init__()
+        self.database_path = database_path
+        self.art_ids = art_ids
+        self.cancelled = False
+        self.signals = HashBackfillSignals()
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        # SQLite connections cannot cross threads, so the worker opens its own
+        name = f"hash-backfill-{id(self)}"
+        db = QSqlDatabase.addDatabase("QSQLITE", name)
+        db.setDatabaseName(self.database_path)
+        db.setConnectOptions("QSQLITE_OPEN_READONLY")
+        if db.open():
+            self.hash_rows(db)
+            db.close()
+        del db
+        QSqlDatabase.removeDatabase(name)
+
+    def hash_rows(self, db):
+        query = QSqlQuery(db)
+        query.prepare("SELECT Pixmap FROM arts WHERE Artld = ?")
+        
+        results = []
+        for art_id in self.art_ids:
+            if self.cancelled:
+                return
+            query.bindValue(0, art_id)
+            if not query.exec() or not query.next():
+                continue
+            pixmap_data = query.value(0)
+            query.finish()
+            
+            image = decode_hash_source(pixmap_data)
+            if pixmap_data and image.isNull():
+                # Left stale, so it is retried instead of being marked as hashless
+                continue
+            results.append((art_id, dhash(image)))
+            if len(results) >= HASH_BACKFILL_BATCH:
+                self.signals.hashed.emit(results)
+                results = []
+        if results:
+            self.signals.hashed.emit(results)
 
 
 class ArtsDatabaseWidget(QWidget):
+    openRequest = pyqtSignal(tuple)
+    revisionSaved = pyqtSignal(tuple)
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.db = None
         self.current_pixmap = None
         self.model = None
+        self.hash_index = MultiIndexHash()
+        self.art_hashes = {}
+        self.hash_task = None
+        self.similar_ids = None
+        self.artist_filter_id = None
+        self.artist_items = {}
         self.init_ui()
         self.init_db()
         
@@ -27,6 +97,9 @@ class ArtsDatabaseWidget(QWidget):
             
         self.model = QSqlTableModel(self, self.db)
         self.update_model()
+        self.load_artist_facets()
+        self.load_hash_index()
+        self.start_hash_backfill()
         return True
 
     def create_tables_if_needed(self):
@@ -51,9 +124,91 @@ class ArtsDatabaseWidget(QWidget):
         """):
             return False
         
+        if not self.add_column_if_missing("arts", "PHash", "TEXT"):
+            return False
+        
+        if not self.add_column_if_missing("arts", "Strokes", "BLOB"):
+            return False
+        
+        if not self.create_artist_counters():
+            return False
+        
+        if not query.exec("""
+            CREATE TABLE IF NOT EXISTS revisions (
+                RevisionId INTEGER PRIMARY KEY AUTOINCREMENT,
+                Artld INTEGER NOT NULL,
+                ParentId INTEGER,
+                Width INTEGER NOT NULL,
+                Height INTEGER NOT NULL,
+                Tiles BLOB,
+                Snapshot BLOB,
+                CreatedAt TEXT DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (Artld) REFERENCES arts(Artld),
+                FOREIGN KEY (ParentId) REFERENCES revisions(RevisionId)
+            )
+        """):
+            return False
+        
+        if not query.exec("CREATE INDEX IF NOT EXISTS idx_revisions_art ON revisions(Artld)"):
+            return False
+        
         self.add_sample_data_if_empty()
         return True
 
+    def has_column(self, table, column):
+        query = QSqlQuery(self.db)
+        query.exec(f"PRAGMA table_info({table})")
+        while query.next():
+            if query.value(1) == column:
+                return True
+        return False
+
+    def add_column_if_missing(self, table, column, definition):
+        if self.has_column(table, column):
+            return True
+        query = QSqlQuery(self.db)
+        return query.exec(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    def create_artist_counters(self):
+        needs_recount = not self.has_column("artists", "ArtCount")
+        if not self.add_column_if_missing("artists", "ArtCount", "INTEGER NOT NULL DEFAULT 0"):
+            return False
+        
+        query = QSqlQuery(self.db)
+        statements = [
+            "CREATE INDEX IF NOT EXISTS idx_arts_artist ON arts(ArtistId)",
+            """
+            CREATE TRIGGER IF NOT EXISTS arts_count_insert AFTER INSERT ON arts
+            BEGIN
+                UPDATE artists SET ArtCount = ArtCount + 1 WHERE ArtistId = NEW.ArtistId;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS arts_count_delete AFTER DELETE ON arts
+            BEGIN
+                UPDATE artists SET ArtCount = ArtCount - 1 WHERE ArtistId = OLD.ArtistId;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS arts_count_update AFTER UPDATE OF ArtistId ON arts
+            WHEN OLD.ArtistId != NEW.ArtistId
+            BEGIN
+                UPDATE artists SET ArtCount = ArtCount - 1 WHERE ArtistId = OLD.ArtistId;
+                UPDATE artists SET ArtCount = ArtCount + 1 WHERE ArtistId = NEW.ArtistId;
+            END
+            """,
+        ]
+        for statement in statements:
+            if not query.exec(statement):
+                return False
+        
+        if needs_recount:
+            return query.exec("""
+                UPDATE artists SET ArtCount =
+                    (SELECT COUNT(*) FROM arts WHERE arts.ArtistId = artists.ArtistId)
+            """)
+        return True
+
     def add_sample_data_if_empty(self):
         query = QSqlQuery(self.db)
         query.exec("SELECT COUNT(*) FROM artists")
@@ -64,6 +219,57 @@ class ArtsDatabaseWidget(QWidget):
                 query.addBindValue(artist)
                 query.exec()
 
+    def load_hash_index(self):
+        self.hash_index = MultiIndexHash()
+        self.art_hashes = {}
+        
+        query = QSqlQuery(self.db)
+        query.setForwardOnly(True)
+        query.exec(f"SELECT Artld, PHash FROM arts WHERE NOT {STALE_HASH}")
+        while query.next():
+            self.index_art_hash(query.value(0), hash_from_text(query.value(1)))
+
+    def index_art_hash(self, art_id, phash):
+        if phash is None:
+            return
+        self.art_hashes[art_id] = phash
+        self.hash_index.add(phash, art_id)
+
+    def unindex_art_hash(self, art_id):
+        phash = self.art_hashes.pop(art_id, None)
+        if phash is not None:
+            self.hash_index.remove(phash, art_id)
+
+    def start_hash_backfill(self):
+        query = QSqlQuery(self.db)
+        query.setForwardOnly(True)
+        query.exec(f"SELECT Artld FROM arts WHERE {STALE_HASH}")
+        art_ids = []
+        while query.next():
+            art_ids.append(query.value(0))
+        
+        if not art_ids:
+            return
+        # Decoding large PNGs happens on a pool thread; only the small UPDATEs run here
+        self.hash_task = HashBackfillTask(self.db.databaseName(), art_ids)
+        self.hash_task.signals.hashed.connect(self.store_backfill_hashes)
+        QApplication.instance().aboutToQuit.connect(self.hash_task.cancel)
+        QThreadPool.globalInstance().start(self.hash_task)
+
+    def store_backfill_hashes(self, results):
+        query = QSqlQuery(self.db)
+        # Rows changed since the worker read them already carry a fresh hash
+        query.prepare(f"UPDATE arts SET PHash = ? WHERE Artld = ? AND {STALE_HASH}")
+        
+        self.db.transaction()
+        for art_id, phash in results:
+            # A bare prefix marks rows without a usable image as processed
+            query.bindValue(0, hash_to_text(phash))
+            query.bindValue(1, art_id)
+            if query.exec() and query.numRowsAffected() > 0:
+                self.index_art_hash(art_id, phash)
+        self.db.commit()
+
     def update_model(self):
         if not self.model:
             return
@@ -110,10 +316,14 @@ class ArtsDatabaseWidget(QWidget):
         self.delete_btn = QPushButton("Delete")
         self.edit_btn = QPushButton("Edit")
         self.refresh_btn = QPushButton("Refresh")
+        self.similar_btn = QPushButton("Find similar")
+        self.open_btn = QPushButton("Open in canvas")
         
         button_layout.addWidget(self.delete_btn)
         button_layout.addWidget(self.edit_btn)
         button_layout.addWidget(self.refresh_btn)
+        button_layout.addWidget(self.similar_btn)
+        button_layout.addWidget(self.open_btn)
         button_layout.addStretch()
         
         self.table_view = QTableView()
@@ -140,10 +350,12 @@ class ArtsDatabaseWidget(QWidget):
         self.id_label = QLabel("—")
         self.title_label = QLabel("—")
         self.artist_label = QLabel("—")
+        self.revision_combo = QComboBox()
         
         details_form.addRow("ID:", self.id_label)
         details_form.addRow("Title:", self.title_label)
         details_form.addRow("Artist:", self.artist_label)
+        details_form.addRow("Revision:", self.revision_combo)
         
         left_layout.addLayout(search_layout)
         left_layout.addLayout(button_layout)
@@ -154,36 +366,133 @@ class ArtsDatabaseWidget(QWidget):
         right_layout.addWidget(self.details_group)
         right_layout.addStretch()
         
+        facet_group = QGroupBox("Artists")
+        facet_layout = QVBoxLayout(facet_group)
+        self.artist_list = QListWidget()
+        facet_layout.addWidget(self.artist_list)
+        
         splitter = QSplitter(Qt.Orientation.Horizontal)
+        splitter.addWidget(facet_group)
         splitter.addWidget(left_widget)
         splitter.addWidget(right_widget)
-        splitter.setSizes([600, 400])
+        splitter.setSizes([200, 500, 400])
         
         main_layout.addWidget(splitter)
         
         self.delete_btn.clicked.connect(self.delete_record)
         self.edit_btn.clicked.connect(self.edit_record)
         self.refresh_btn.clicked.connect(self.refresh_data)
+        self.similar_btn.clicked.connect(self.find_similar)
+        self.open_btn.clicked.connect(self.open_in_canvas)
+        self.revision_combo.currentIndexChanged.connect(self.show_revision)
+        self.artist_list.currentItemChanged.connect(self.filter_by_artist)
         self.search_edit.textChanged.connect(self.search_records)
         
     def search_records(self):
         if not self.model:
             return
             
-        search_text = self.search_edit.text().strip()
+        self.apply_filters()
+        
+    def apply_filters(self):
+        filters = []
+        
+        search_text = self.search_edit.text().strip().replace("'", "''")
         if search_text:
-            filter_str = f"Title LIKE '%{search_text}%' OR ArtistName LIKE '%{search_text}%'"
-            self.model.setFilter(filter_str)
-        else:
-            self.model.setFilter("")
+            filters.append(f"(Title LIKE '%{search_text}%' OR ArtistName LIKE '%{search_text}%')")
+        
+        if self.similar_ids is not None:
+            ids = ", ".join(str(int(art_id)) for art_id in self.similar_ids)
+            filters.append(f"Artld IN ({ids})")
         
+        if self.artist_filter_id is not None:
+            filters.append(f"ArtistId = {int(self.artist_filter_id)}")
+        
+        self.model.setFilter(" AND ".join(filters))
         self.model.select()
         
     def refresh_data(self):
         if self.model:
-            self.model.select()
+            self.similar_ids = None
+            self.apply_filters()
             self.clear_details()
         
+    def load_artist_facets(self):
+        self.artist_list.blockSignals(True)
+        self.artist_list.clear()
+        self.artist_items = {}
+        
+        all_item = QListWidgetItem("All artists")
+        all_item.setData(Qt.ItemDataRole.UserRole, None)
+        self.artist_list.addItem(all_item)
+        
+        query = QSqlQuery(self.db)
+        query.exec("SELECT ArtistId, Name, ArtCount FROM artists ORDER BY Name")
+        while query.next():
+            item = QListWidgetItem(f"{query.value(1)} ({query.value(2)})")
+            item.setData(Qt.ItemDataRole.UserRole, query.value(0))
+            item.setData(Qt.ItemDataRole.UserRole + 1, query.value(1))
+            self.artist_list.addItem(item)
+            self.artist_items[query.value(0)] = item
+        
+        self.artist_list.setCurrentItem(all_item)
+        self.artist_list.blockSignals(False)
+
+    def refresh_artist_facet(self, artist_id):
+        if artist_id is None:
+            return
+            
+        query = QSqlQuery(self.db)
+        query.prepare("SELECT Name, ArtCount FROM artists WHERE ArtistId = ?")
+        query.addBindValue(artist_id)
+        if not query.exec() or not query.next():
+            return
+        name, count = query.value(0), query.value(1)
+        
+        item = self.artist_items.get(artist_id)
+        if item is None:
+            item = QListWidgetItem()
+            item.setData(Qt.ItemDataRole.UserRole, artist_id)
+            item.setData(Qt.ItemDataRole.UserRole + 1, name)
+            row = 1
+            while (row < self.artist_list.count()
+                   and self.artist_list.item(row).data(Qt.ItemDataRole.UserRole + 1) < name):
+                row += 1
+            self.artist_list.insertItem(row, item)
+            self.artist_items[artist_id] = item
+        item.setText(f"{name} ({count})")
+
+    def filter_by_artist(self, current, previous=None):
+        if not self.model:
+            return
+            
+        self.artist_filter_id = current.data(Qt.ItemDataRole.UserRole) if current else None
+        self.apply_filters()
+        self.clear_details()
+
+    def find_similar(self):
+        if not self.model:
+            return
+            
+        selected = self.table_view.selectionModel().selectedRows()
+        if not selected:
+            QMessageBox.warning(self, "Warning", "Select artwork to compare")
+            return
+            
+        art_id = self.model.record(selected[0].row()).value("Artld")
+        phash = self.art_hashes.get(art_id)
+        if phash is None:
+            QMessageBox.warning(self, "Warning", "Artwork has no image to compare")
+            return
+        
+        matches = self.hash_index.search(phash, SIMILAR_DISTANCE)
+        self.similar_ids = [match_id for _, match_id in matches]
+        self.apply_filters()
+        self.clear_details()
+        
+        if len(self.similar_ids) <= 1:
+            QMessageBox.information(self, "Find similar", "No similar artworks found")
+        
     def show_details(self, selected=None, deselected=None):
         if not self.model:
             return
@@ -202,28 +511,22 @@ class ArtsDatabaseWidget(QWidget):
         
         pixmap_data = record.value("Pixmap")
         self.display_pixmap(pixmap_data)
+        self.load_revision_history(record.value("Artld"))
         
     def display_pixmap(self, pixmap_data):
         if pixmap_data:
             try:
-                pixmap = QPixmap()
+                preview_size = QSize(self.image_label.width() - 20, self.image_label.height() - 20)
                 
-                if isinstance(pixmap_data, QByteArray):
-                    success = pixmap.loadFromData(pixmap_data)
-                elif isinstance(pixmap_data, (bytes, bytearray)):
-                    success = pixmap.loadFromData(pixmap_data)
+                if isinstance(pixmap_data, (QByteArray, bytes, bytearray)):
+                    pixmap = QPixmap.fromImage(read_preview(pixmap_data, preview_size))
+                    success = not pixmap.isNull()
                 else:
                     self.image_label.setText("Unknown image format")
                     return
                 
                 if success and not pixmap.isNull():
-                    scaled_pixmap = pixmap.scaled(
-                        self.image_label.width() - 20, 
-                        self.image_label.height() - 20,
-                        Qt.AspectRatioMode.KeepAspectRatio,
-                        Qt.TransformationMode.SmoothTransformation
-                    )
-                    self.image_label.setPixmap(scaled_pixmap)
+                    self.display_scaled(pixmap)
                     self.current_pixmap = pixmap_data
                     return
                 else:
@@ -235,10 +538,58 @@ class ArtsDatabaseWidget(QWidget):
         self.image_label.setText("Image unavailable")
         self.current_pixmap = None
         
+    def display_scaled(self, pixmap):
+        scaled_pixmap = pixmap.scaled(
+            self.image_label.width() - 20, 
+            self.image_label.height() - 20,
+            Qt.AspectRatioMode.KeepAspectRatio,
+            Qt.TransformationMode.SmoothTransformation
+        )
+        self.image_label.setPixmap(scaled_pixmap)
+        
+    def load_revision_history(self, art_id):
+        self.revision_combo.blockSignals(True)
+        self.revision_combo.clear()
+        
+        query = QSqlQuery(self.db)
+        query.prepare("SELECT RevisionId, CreatedAt FROM revisions WHERE Artld = ? ORDER BY RevisionId DESC")
+        query.addBindValue(art_id)
+        revisions = []
+        if query.exec():
+            while query.next():
+                revisions.append((query.value(0), query.value(1)))
+        
+        if revisions:
+            for i, (revision_id, created_at) in enumerate(revisions):
+                text = f"Revision {len(revisions) - i} ({created_at})"
+                if i == 0:
+                    text += " — latest"
+                self.revision_combo.addItem(text, revision_id)
+        else:
+            self.revision_combo.addItem("Original", None)
+        
+        self.revision_combo.blockSignals(False)
+        
+    def show_revision(self, index):
+        if index < 0:
+            return
+        if index == 0:
+            self.display_pixmap(self.current_pixmap)
+            return
+            
+        image = self.reconstruct_revision(self.revision_combo.itemData(index))
+        if image is None:
+            self.image_label.setText("Revision unavailable")
+            return
+        self.display_scaled(QPixmap.fromImage(image))
+        
     def clear_details(self):
         self.id_label.setText("—")
         self.title_label.setText("—")
         self.artist_label.setText("—")
+        self.revision_combo.blockSignals(True)
+        self.revision_combo.clear()
+        self.revision_combo.blockSignals(False)
         self.image_label.clear()
         self.image_label.setText("Select artwork to view")
         self.current_pixmap = None
@@ -256,6 +607,7 @@ class ArtsDatabaseWidget(QWidget):
         record = self.model.record(row)
         title = record.value("Title")
         artist_name = record.value("ArtistName")
+        artist_id = record.value("ArtistId")
         
         reply = QMessageBox.question(
             self, 
@@ -267,14 +619,26 @@ class ArtsDatabaseWidget(QWidget):
         if reply == QMessageBox.StandardButton.Yes:
             art_id = record.value("Artld")
             query = QSqlQuery(self.db)
-            query.prepare("DELETE FROM arts WHERE Artld = ?")
+
+            # Revisions and the artwork go together, or neither does
+            self.db.transaction()
+            query.prepare("DELETE FROM revisions WHERE Artld = ?")
             query.addBindValue(art_id)
-            
-            if query.exec():
+            deleted = query.exec()
+
+            if deleted:
+                query.prepare("DELETE FROM arts WHERE Artld = ?")
+                query.addBindValue(art_id)
+                deleted = query.exec()
+
+            if deleted and self.db.commit():
+                self.unindex_art_hash(art_id)
+                self.refresh_artist_facet(artist_id)
                 self.model.select()
                 self.clear_details()
                 QMessageBox.information(self, "Success", "Record deleted")
             else:
+                self.db.rollback()
                 QMessageBox.critical(self, "Error", "Delete failed")
                 
     def edit_record(self):
@@ -290,6 +654,7 @@ class ArtsDatabaseWidget(QWidget):
         record = self.model.record(row)
         
         art_id = record.value("Artld")
+        old_artist_id = record.value("ArtistId")
         
         dialog = EditArtDialog(record, self.db, self)
         if dialog.exec() == QDialog.DialogCode.Accepted:
@@ -302,11 +667,147 @@ class ArtsDatabaseWidget(QWidget):
             query.addBindValue(art_id)
             
             if query.exec():
+                self.refresh_artist_facet(old_artist_id)
+                self.refresh_artist_facet(new_artist_id)
                 self.model.select()
                 self.show_details()
             else:
                 QMessageBox.critical(self, "Error", f"Update failed: {query.lastError().text()}")
     
+    def open_in_canvas(self):
+        if not self.model:
+            return
+            
+        selected = self.table_view.selectionModel().selectedRows()
+        if not selected:
+            QMessageBox.warning(self, "Warning", "Select artwork to open")
+            return
+            
+        art_id = self.model.record(selected[0].row()).value("Artld")
+        revision_id = self.revision_combo.currentData()
+        
+        # The latest revision is always materialised in arts.Pixmap and is
+        # passed on encoded, so large pictures never have to be decoded whole
+        image = data = None
+        if self.revision_combo.currentIndex() <= 0:
+            data = self.load_art_data(art_id)
+            valid = data is not None and image_size(data).isValid()
+        else:
+            image = self.reconstruct_revision(revision_id)
+            valid = image is not None and not image.isNull()
+            
+        if not valid:
+            QMessageBox.critical(self, "Error", "Image load error")
+            return
+        
+        self.openRequest.emit((art_id, revision_id, image, data))
+    
+    def load_art_data(self, art_id):
+        query = QSqlQuery(self.db)
+        query.prepare("SELECT Pixmap FROM arts WHERE Artld = ?")
+        query.addBindValue(art_id)
+        if not query.exec() or not query.next():
+            return None
+        return query.value(0) or None
+    
+    def latest_revision_id(self, art_id):
+        query = QSqlQuery(self.db)
+        query.prepare("SELECT MAX(RevisionId) FROM revisions WHERE Artld = ?")
+        query.addBindValue(art_id)
+        if query.exec() and query.next():
+            return query.value(0) or None
+        return None
+    
+    def reconstruct_revision(self, revision_id):
+        chain = []
+        query = QSqlQuery(self.db)
+        query.prepare("SELECT ParentId, Width, Height, Tiles, Snapshot FROM revisions WHERE RevisionId = ?")
+        while revision_id:
+            query.bindValue(0, revision_id)
+            if not query.exec() or not query.next():
+                return None
+            snapshot = query.value(4)
+            chain.append((query.value(1), query.value(2), query.value(3), snapshot))
+            # A snapshot is a full image, so older revisions are not needed
+            revision_id = None if snapshot else query.value(0)
+        
+        image = None
+        for width, height, tiles_data, snapshot in reversed(chain):
+            if snapshot:
+                image = normalize_image(QImage.fromData(snapshot))
+            elif image is None:
+                image = blank_image(width, height)
+            else:
+                image = resize_image(image, width, height)
+            apply_tiles(image, decode_tiles(tiles_data))
+        return image
+    
+    def insert_revision(self, art_id, parent_id, width, height, tiles, snapshot=None):
+        query = QSqlQuery(self.db)
+        query.prepare("INSERT INTO revisions (Artld, ParentId, Width, Height, Tiles, Snapshot) VALUES (?, ?, ?, ?, ?, ?)")
+        query.addBindValue(art_id)
+        query.addBindValue(parent_id)
+        query.addBindValue(width)
+        query.addBindValue(height)
+        query.addBindValue(encode_tiles(tiles))
+        query.addBindValue(snapshot if snapshot is not None else QByteArray())
+        if not query.exec():
+            raise RuntimeError(query.lastError().text())
+        return query.lastInsertId()
+    
+    def save_revision(self, args):
+        art_id, parent_id, image, tiles = args
+        
+        pixmap_data = self.pixmap_to_bytes(image)
+        snapshot = None
+        
+        self.db.transaction()
+        try:
+            if parent_id is None:
+                parent_id = self.latest_revision_id(art_id)
+                if parent_id is None:
+                    # The original picture becomes the root revision as is
+                    base_data = self.load_art_data(art_id)
+                    base_size = image_size(base_data) if base_data else QSize()
+                    if not base_size.isValid():
+                        base_size = image.size()
+                        base_data = self.pixmap_to_bytes(blank_image(image.width(), image.height()))
+                    parent_id = self.insert_revision(
+                        art_id, None, base_size.width(), base_size.height(), {}, base_data
+                    )
+                else:
+                    # Canvas was opened from a version that has been superseded since
+                    tiles = {}
+                    snapshot = pixmap_data
+            
+            revision_id = self.insert_revision(
+                art_id, parent_id, image.width(), image.height(), tiles, snapshot
+            )
+            
+
+            phash = dhash(image)
+            query = QSqlQuery(self.db)
+            # The stroke log no longer describes an edited raster
+            query.prepare("UPDATE arts SET Pixmap = ?, PHash = ?, Strokes = NULL WHERE Artld = ?")
+            query.addBindValue(pixmap_data)
+            query.addBindValue(hash_to_text(phash))
+            query.addBindValue(art_id)
+            if not query.exec():
+                raise RuntimeError(query.lastError().text())
+            
+            self.db.commit()
+        except Exception as e:
+            self.db.rollback()
+            QMessageBox.critical(self, "Error", f"Revision save failed: {str(e)}")
+            return False
+        
+        self.unindex_art_hash(art_id)
+        self.index_art_hash(art_id, phash)
+        self.model.select()
+        self.clear_details()
+        self.revisionSaved.emit((art_id, revision_id, image))
+        return True
+    
     def get_or_create_artist(self, artist_name):
         if not artist_name or not artist_name.strip():
             return None
@@ -324,16 +825,19 @@ class ArtsDatabaseWidget(QWidget):
                 return query.lastInsertId()
             return None
             
-    def add_art_record(self, title, artist_id, pixmap_data):
+    def add_art_record(self, title, artist_id, pixmap_data, phash=None, strokes_data=None):
         if not self.model:
             return False
             
         if not artist_id:
             QMessageBox.critical(self, "Error", "Artist ID not specified")
             return False
+        
+        if phash is None:
+            phash = hash_image_data(pixmap_data)
             
         query = QSqlQuery(self.db)
-        query.prepare("INSERT INTO arts (Title, ArtistId, Pixmap) VALUES (?, ?, ?)")
+        query.prepare("INSERT INTO arts (Title, ArtistId, Pixmap, PHash, Strokes) VALUES (?, ?, ?, ?, ?)")
         query.addBindValue(title)
         query.addBindValue(artist_id)
         
@@ -343,8 +847,12 @@ class ArtsDatabaseWidget(QWidget):
             query.addBindValue(pixmap_data)
         else:
             query.addBindValue(QByteArray())
+        query.addBindValue(hash_to_text(phash))
+        query.addBindValue(QByteArray(strokes_data) if strokes_data else QByteArray())
         
         if query.exec():
+            self.index_art_hash(query.lastInsertId(), phash)
+            self.refresh_artist_facet(artist_id)
             self.model.select()
             self.table_view.selectRow(self.model.rowCount() - 1)
             return True
@@ -353,14 +861,18 @@ class ArtsDatabaseWidget(QWidget):
             return False
 
     def publish_art(self, args):
-        title, artist_name, pixmap_data = args
+        title, artist_name, pixmap_data, strokes_data, image = args
         try:
+            phash = dhash(image)
+            if not self.confirm_publish_duplicate(phash):
+                return False
+            
             artist_id = self.get_or_create_artist(artist_name)
             if not artist_id:
                 QMessageBox.critical(self, "Error", f"Failed to get/create artist: {artist_name}")
                 return False
             
-            success = self.add_art_record(title, artist_id, pixmap_data)
+            success = self.add_art_record(title, artist_id, pixmap_data, phash, strokes_data)
             
             if success:
                 self.refresh_data()
@@ -371,6 +883,31 @@ class ArtsDatabaseWidget(QWidget):
             QMessageBox.critical(self, "Error", f"Publish error: {str(e)}")
             return False
             
+    def confirm_publish_duplicate(self, phash):
+        if phash is None:
+            return True
+            
+        matches = self.hash_index.search(phash, DUPLICATE_DISTANCE)
+        if not matches:
+            return True
+        
+        lines = []
+        query = QSqlQuery(self.db)
+        query.prepare("SELECT Title, ArtistName FROM arts_display WHERE Artld = ?")
+        for _, art_id in matches[:5]:
+            query.bindValue(0, art_id)
+            if query.exec() and query.next():
+                lines.append(f"#{art_id}: {query.value(0)} ({query.value(1)})")
+        
+        reply = QMessageBox.question(
+            self,
+            "Possible duplicate",
+            "Very similar artwork is already in the gallery:\n\n"
+            + "\n".join(lines) + "\n\nPublish anyway?",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+        )
+        return reply == QMessageBox.StandardButton.Yes
+            
     def get_artists_list(self):
         artists = []
         if not self.db:
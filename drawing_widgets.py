@@ -1,11 +1,28 @@
+import math
 from PyQt6.QtWidgets import *
-from PyQt6.QtCore import Qt, QPoint, pyqtSignal, QRect
-from PyQt6.QtGui import QPainter, QPen, QColor, QPixmap, QCursor
+from PyQt6.QtCore import Qt, QPoint, QPointF, pyqtSignal, QRect, QRectF, QTimer
+from PyQt6.QtGui import QPainter, QPainterPath, QColor, QImage, QPixmap, QCursor, QPalette
 from database import ArtsDatabaseWidget
+from revisions import (diff_regions, diff_tiles, normalize_image, tile_rect, tiles_in_path,
+                       tiles_in_rect)
+from render_cache import MipPyramid, scale_rect_down, scale_rect_up
+from vector_log import SHAPE_TOOLS, StrokeCommand, StrokeLog, make_pen, stroke_outline
+from tile_store import TileStore
+from image_io import image_size
+
+MIN_ZOOM = 1 / 64
+MAX_ZOOM = 32
+ZOOM_STEP = 1.25
+OUT_OF_CORE_PIXELS = 4096 * 4096
+PYRAMID_BUDGET = 64 * 1024 * 1024
 
 
 class DrawingWidget(QWidget):
     publishRequest = pyqtSignal(tuple)
+    revisionRequest = pyqtSignal(tuple)
+    documentChanged = pyqtSignal(str)
+    zoomChanged = pyqtSignal(float)
+    workingSetChanged = pyqtSignal(dict)
 
     def __init__(self):
         super().__init__()
@@ -18,104 +35,272 @@ class DrawingWidget(QWidget):
         self.tool = "pen"
         self.pixmap = QPixmap(600, 400)
         self.pixmap.fill(Qt.GlobalColor.white)
-        self.temp_pixmap = QPixmap(600, 400)
-        self.temp_pixmap.fill(Qt.GlobalColor.transparent)
+        self.tiles = None
         self.setCursor(QCursor(Qt.CursorShape.CrossCursor))
         self.start_point = QPoint()
+        self.document = None
+        self.base_image = None
+        self.damaged_tiles = set()
+        self.zoom = 1.0
+        self.offset = QPointF(0, 0)
+        self.panning = False
+        self.pan_origin = QPointF()
+        self.canvas_locked = False
+        self.pyramid = MipPyramid(self.canvas_region, 600, 400)
+        self.stroke_log = StrokeLog(600, 400)
+        self.current_command = None
+        self.stats_timer = QTimer(self)
+        self.stats_timer.setInterval(1000)
+        self.stats_timer.timeout.connect(self.emit_working_set)
+
+    def canvas_rect(self):
+        if self.tiles is not None:
+            return self.tiles.rect()
+        return self.pixmap.rect()
+
+    def canvas_region(self, rect):
+        if self.tiles is not None:
+            return self.tiles.region(rect)
+        return self.pixmap.copy(rect).toImage()
+
+    def canvas_image(self):
+        if self.tiles is not None:
+            return self.tiles.to_image()
+        return self.pixmap.toImage()
+
+    def replace_canvas(self, width, height, image=None, out_of_core=False, data=None):
+        if self.tiles is not None:
+            self.tiles.close()
+            self.tiles = None
+
+        if out_of_core:
+            # Out-of-core canvases keep only a bounded set of tiles in memory
+            self.pixmap = None
+            self.tiles = TileStore(width, height)
+            if image is not None:
+                self.tiles.load_image(image)
+            elif data is not None:
+                self.tiles.load_data(data)
+            self.pyramid.resize(width, height, PYRAMID_BUDGET)
+            self.stats_timer.start()
+        else:
+            if image is not None:
+                self.pixmap = QPixmap.fromImage(image)
+            else:
+                self.pixmap = QPixmap(width, height)
+                self.pixmap.fill(Qt.GlobalColor.white)
+            self.pyramid.resize(width, height)
+            self.stats_timer.stop()
+
+        self.damaged_tiles = set()
+        self.canvas_locked = True
+        self.emit_working_set()
+
+    def working_set_stats(self):
+        if self.tiles is None:
+            return {}
+        stats = self.tiles.stats()
+        stats["pyramid_bytes"] = self.pyramid.memory_bytes()
+        return stats
+
+    def emit_working_set(self):
+        self.workingSetChanged.emit(self.working_set_stats())
+
+    def paint_canvas(self, path, draw):
+        outline = stroke_outline(path, make_pen(self.tool, self.pen_color, self.pen_width))
+
+        def paint(painter):
+            self.setup_painter(painter)
+            draw(painter)
+
+        if self.tiles is not None:
+            self.tiles.paint(outline, paint)
+        else:
+            painter = QPainter(self.pixmap)
+            paint(painter)
+            painter.end()
+        self.mark_path_damaged(outline)
+        self.update()
+
+    def mark_damaged(self, rect, margin=0):
+        canvas_rect = self.canvas_rect()
+        rect = rect.normalized().adjusted(-margin, -margin, margin, margin)
+        self.damaged_tiles |= tiles_in_rect(rect, canvas_rect.width(), canvas_rect.height())
+        self.pyramid.invalidate(rect.intersected(canvas_rect))
+
+    def mark_path_damaged(self, outline):
+        canvas_rect = self.canvas_rect()
+        keys = tiles_in_path(outline, canvas_rect.width(), canvas_rect.height())
+        self.damaged_tiles |= keys
+        for key in keys:
+            self.pyramid.invalidate(tile_rect(key).intersected(canvas_rect))
+
+    def map_to_canvas(self, pos):
+        return QPoint(math.floor((pos.x() - self.offset.x()) / self.zoom),
+                      math.floor((pos.y() - self.offset.y()) / self.zoom))
+
+    def visible_canvas_rect(self):
+        top_left = self.map_to_canvas(QPointF(0, 0))
+        bottom_right = self.map_to_canvas(QPointF(self.width(), self.height()))
+        return QRect(top_left, bottom_right).adjusted(-1, -1, 1, 1).intersected(self.canvas_rect())
+
+    def set_zoom(self, zoom, anchor=None):
+        zoom = max(MIN_ZOOM, min(MAX_ZOOM, zoom))
+        if anchor is None:
+            anchor = QPointF(self.width() / 2, self.height() / 2)
+        canvas_x = (anchor.x() - self.offset.x()) / self.zoom
+        canvas_y = (anchor.y() - self.offset.y()) / self.zoom
+        self.zoom = zoom
+        self.offset = QPointF(anchor.x() - canvas_x * zoom, anchor.y() - canvas_y * zoom)
+        self.zoomChanged.emit(self.zoom)
+        self.update()
+
+    def zoom_to_fit(self):
+        width, height = self.canvas_rect().width(), self.canvas_rect().height()
+        self.zoom = max(MIN_ZOOM, min(MAX_ZOOM, 1.0, self.width() / width, self.height() / height))
+        self.offset = QPointF((self.width() - width * self.zoom) / 2,
+                              (self.height() - height * self.zoom) / 2)
+        self.zoomChanged.emit(self.zoom)
+        self.update()
+
+    def apply_zoom_action(self, action):
+        if action == "in":
+            self.set_zoom(self.zoom * ZOOM_STEP)
+        elif action == "out":
+            self.set_zoom(self.zoom / ZOOM_STEP)
+        elif action == "fit":
+            self.zoom_to_fit()
+        elif action == "reset":
+            self.zoom = 1.0
+            self.offset = QPointF(0, 0)
+            self.zoomChanged.emit(self.zoom)
+            self.update()
+
+    def wheelEvent(self, event):
+        delta = event.angleDelta()
+        if event.modifiers() & Qt.KeyboardModifier.ControlModifier:
+            factor = ZOOM_STEP if delta.y() > 0 else 1 / ZOOM_STEP
+            self.set_zoom(self.zoom * factor, event.position())
+        else:
+            self.offset += QPointF(delta.x(), delta.y()) / 3
+            self.update()
 
     def mousePressEvent(self, event):
-        if event.button() == Qt.MouseButton.LeftButton:
+        if event.button() == Qt.MouseButton.MiddleButton:
+            self.panning = True
+            self.pan_origin = event.position()
+            self.setCursor(QCursor(Qt.CursorShape.ClosedHandCursor))
+        elif event.button() == Qt.MouseButton.LeftButton:
+            point = self.map_to_canvas(event.position())
             self.drawing = True
-            self.last_point = event.pos()
-            self.start_point = event.pos()
+            self.last_point = point
+            self.start_point = point
+            self.current_command = StrokeCommand(
+                self.tool, self.pen_color.name(QColor.NameFormat.HexArgb),
+                self.pen_width, [(point.x(), point.y())])
 
             if self.tool == "pen":
-                self.draw_point(event.pos())
+                self.draw_point(point)
 
     def mouseMoveEvent(self, event):
+        if self.panning:
+            self.offset += event.position() - self.pan_origin
+            self.pan_origin = event.position()
+            self.update()
+            return
+
+        point = self.map_to_canvas(event.position())
         if self.drawing and event.buttons() & Qt.MouseButton.LeftButton:
+            if self.tool in ["pen", "eraser"]:
+                self.current_command.points.append((point.x(), point.y()))
+
             if self.tool == "pen":
-                self.draw_line(self.last_point, event.pos())
-                self.last_point = event.pos()
+                self.draw_line(self.last_point, point)
+                self.last_point = point
             elif self.tool == "eraser":
-                self.erase(event.pos())
-                self.last_point = event.pos()
+                self.erase(self.last_point, point)
+                self.last_point = point
             else:
-                self.temp_pixmap.fill(Qt.GlobalColor.transparent)
-                painter = QPainter(self.temp_pixmap)
-                self.setup_painter(painter)
-
-                if self.tool == "line":
-                    painter.drawLine(self.start_point, event.pos())
-                elif self.tool == "rectangle":
-                    rect = QRect(self.start_point, event.pos()).normalized()
-                    painter.drawRect(rect)
-                elif self.tool == "ellipse":
-                    rect = QRect(self.start_point, event.pos()).normalized()
-                    painter.drawEllipse(rect)
-
-                painter.end()
+                # Shape previews are drawn as vectors in paintEvent
+                self.current_command.points = [
+                    (self.start_point.x(), self.start_point.y()), (point.x(), point.y())]
                 self.update()
 
     def mouseReleaseEvent(self, event):
-        if event.button() == Qt.MouseButton.LeftButton and self.drawing:
+        if event.button() == Qt.MouseButton.MiddleButton and self.panning:
+            self.panning = False
+            self.setCursor(QCursor(Qt.CursorShape.CrossCursor))
+        elif event.button() == Qt.MouseButton.LeftButton and self.drawing:
             self.drawing = False
+            point = self.map_to_canvas(event.position())
 
-            if self.tool in ["line", "rectangle", "ellipse"]:
-                painter = QPainter(self.pixmap)
-                self.setup_painter(painter)
-
-                if self.tool == "line":
-                    painter.drawLine(self.start_point, event.pos())
-                elif self.tool == "rectangle":
-                    rect = QRect(self.start_point, event.pos()).normalized()
-                    painter.drawRect(rect)
-                elif self.tool == "ellipse":
-                    rect = QRect(self.start_point, event.pos()).normalized()
-                    painter.drawEllipse(rect)
-
-                painter.end()
-                self.temp_pixmap.fill(Qt.GlobalColor.transparent)
-                self.update()
+            command = self.current_command
+            self.current_command = None
+            if command is None:
+                return
+            command.points.append((point.x(), point.y()))
+            command.simplify()
+
+            if self.tool in SHAPE_TOOLS:
+                self.paint_canvas(command.path(), command.draw)
+            self.stroke_log.add(command)
+
+    def segment_path(self, start, end):
+        path = QPainterPath(QPointF(start))
+        path.lineTo(QPointF(end))
+        return path
 
     def draw_point(self, point):
-        painter = QPainter(self.pixmap)
-        self.setup_painter(painter)
-        painter.drawPoint(point)
-        painter.end()
-        self.update()
+        self.paint_canvas(self.segment_path(point, point), lambda painter: painter.drawPoint(point))
 
     def draw_line(self, start, end):
-        painter = QPainter(self.pixmap)
-        self.setup_painter(painter)
-        painter.drawLine(start, end)
-        painter.end()
-        self.update()
+        self.paint_canvas(self.segment_path(start, end), lambda painter: painter.drawLine(start, end))
 
-    def erase(self, point):
-        painter = QPainter(self.pixmap)
-        painter.setPen(QPen(Qt.GlobalColor.white, self.pen_width * 2))
-        painter.drawPoint(point)
-        painter.end()
-        self.update()
+    def erase(self, start, end):
+        self.paint_canvas(self.segment_path(start, end), lambda painter: painter.drawLine(start, end))
 
     def setup_painter(self, painter):
-        if self.tool == "eraser":
-            painter.setPen(QPen(Qt.GlobalColor.white, self.pen_width * 2))
-        else:
-            painter.setPen(QPen(self.pen_color, self.pen_width,
-                                Qt.PenStyle.SolidLine, Qt.PenCapStyle.RoundCap,
-                                Qt.PenJoinStyle.RoundJoin))
+        painter.setPen(make_pen(self.tool, self.pen_color, self.pen_width))
         painter.setRenderHint(QPainter.RenderHint.Antialiasing)
 
     def paintEvent(self, event):
         painter = QPainter(self)
-        painter.drawPixmap(0, 0, self.pixmap)
-        painter.drawPixmap(0, 0, self.temp_pixmap)
+        painter.fillRect(self.rect(), self.palette().color(QPalette.ColorRole.Mid))
+
+        visible = self.visible_canvas_rect()
+        if visible.isEmpty():
+            return
+
+        painter.translate(self.offset)
+        painter.scale(self.zoom, self.zoom)
+        if self.zoom < 1:
+            painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+
+        # Zoomed-out views draw from the downsampled cache, not the full canvas
+        level = self.pyramid.level_for_zoom(self.zoom)
+        if level > 0:
+            image = self.pyramid.image(level)
+            source = scale_rect_down(visible, level).intersected(image.rect())
+            painter.drawImage(QRectF(scale_rect_up(source, level)), image, QRectF(source))
+        elif self.tiles is not None:
+            self.tiles.prefetch(visible)
+            painter.setClipRect(self.canvas_rect())
+            self.tiles.draw_region(painter, visible)
+        else:
+            painter.drawPixmap(visible, self.pixmap, visible)
+
+        if self.drawing and self.current_command is not None and self.tool in SHAPE_TOOLS:
+            painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+            self.current_command.draw(painter)
 
     def clear(self):
-        self.pixmap.fill(Qt.GlobalColor.white)
-        self.temp_pixmap.fill(Qt.GlobalColor.transparent)
+        if self.tiles is not None:
+            self.tiles.clear()
+        else:
+            self.pixmap.fill(Qt.GlobalColor.white)
+        canvas_rect = self.canvas_rect()
+        self.mark_damaged(canvas_rect)
+        self.stroke_log = StrokeLog(canvas_rect.width(), canvas_rect.height())
         self.update()
 
     def set_tool(self, tool):
@@ -128,6 +313,11 @@ class DrawingWidget(QWidget):
         self.pen_width = width
 
     def resizeEvent(self, event):
+        # Opened artworks and explicitly sized canvases keep their own size
+        if self.canvas_locked:
+            super().resizeEvent(event)
+            return
+
         new_pixmap = QPixmap(self.size())
         new_pixmap.fill(Qt.GlobalColor.white)
 
@@ -136,14 +326,99 @@ class DrawingWidget(QWidget):
         painter.end()
 
         self.pixmap = new_pixmap
-        self.temp_pixmap = QPixmap(self.size())
-        self.temp_pixmap.fill(Qt.GlobalColor.transparent)
+        self.pyramid.resize(self.pixmap.width(), self.pixmap.height())
+        self.stroke_log.resize(self.pixmap.width(), self.pixmap.height())
         super().resizeEvent(event)
 
     def publish_art(self, data):
         artist_name, art_name = data
-        converted_pixmap = ArtsDatabaseWidget.pixmap_to_bytes(self.pixmap)
-        self.publishRequest.emit((art_name, artist_name, converted_pixmap))
+        # The canvas is encoded and hashed from a single full-size image
+        image = self.canvas_image()
+        converted_pixmap = ArtsDatabaseWidget.pixmap_to_bytes(image)
+        # A log drawn over an opened raster cannot reproduce the picture alone
+        strokes = None if self.stroke_log.base else self.stroke_log.to_bytes()
+        self.publishRequest.emit((art_name, artist_name, converted_pixmap, strokes, image))
+
+    def base_canvas_image(self):
+        if self.tiles is not None:
+            return self.tiles.base_region(self.tiles.rect())
+        return self.base_image
+
+    def export_svg(self, filename):
+        base_image = self.base_canvas_image() if self.stroke_log.base else None
+        return self.stroke_log.export_svg(filename, base_image)
+
+    def confirm_discard(self):
+        if not self.damaged_tiles and not self.stroke_log.commands:
+            return True
+        reply = QMessageBox.question(
+            self,
+            "Unsaved changes",
+            "The canvas has changes that are not published or saved.\n\nDiscard them?",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+        )
+        return reply == QMessageBox.StandardButton.Yes
+
+    def open_artwork(self, args):
+        art_id, revision_id, image, data = args
+        if not self.confirm_discard():
+            return False
+        size = image.size() if image is not None else image_size(data)
+        out_of_core = size.width() * size.height() > OUT_OF_CORE_PIXELS
+        # Large pictures go straight from the encoded data into tiles
+        if image is None and not out_of_core:
+            image = QImage.fromData(data)
+        self.replace_canvas(size.width(), size.height(), image, out_of_core, data)
+        # Out-of-core canvases keep their base as pre-edit tiles in the scratch file
+        self.base_image = normalize_image(image) if self.tiles is None else None
+        self.document = (art_id, revision_id)
+        self.stroke_log = StrokeLog(size.width(), size.height(), base=True)
+        self.documentChanged.emit(f"Editing artwork #{art_id}")
+        self.zoom_to_fit()
+        return True
+
+    def new_canvas(self, args):
+        width, height, low_memory = args
+        if not self.confirm_discard():
+            return
+        self.replace_canvas(width, height,
+                            out_of_core=low_memory or width * height > OUT_OF_CORE_PIXELS)
+        self.base_image = None
+        self.document = None
+        self.stroke_log = StrokeLog(width, height)
+        self.documentChanged.emit("")
+        self.zoom_to_fit()
+
+    def save_revision(self):
+        if self.document is None:
+            QMessageBox.warning(self, "Warning", "Open artwork from the gallery first")
+            return
+
+        art_id, revision_id = self.document
+        if self.tiles is not None:
+            tiles = diff_regions(self.tiles.region, self.tiles.base_region, self.damaged_tiles,
+                                 self.tiles.width, self.tiles.height)
+        else:
+            tiles = diff_tiles(self.canvas_image(), self.base_image, self.damaged_tiles)
+        if not tiles:
+            QMessageBox.information(self, "Revision", "No changes to save")
+            return
+
+        self.revisionRequest.emit((art_id, revision_id, self.canvas_image(), tiles))
+
+    def on_revision_saved(self, args):
+        art_id, revision_id, image = args
+        if self.document is None or self.document[0] != art_id:
+            return
+
+        self.document = (art_id, revision_id)
+        if self.tiles is not None:
+            self.tiles.checkpoint()
+        else:
+            self.base_image = normalize_image(image)
+        self.damaged_tiles = set()
+        self.stroke_log = StrokeLog(image.width(), image.height(), base=True)
+        self.documentChanged.emit(f"Editing artwork #{art_id} (saved)")
 
 
 class ToolPanel(QWidget):
@@ -153,6 +428,9 @@ class ToolPanel(QWidget):
     clear_requested = pyqtSignal()
     save_requested = pyqtSignal()
     publish_requested = pyqtSignal(tuple)
+    revision_requested = pyqtSignal()
+    zoom_requested = pyqtSignal(str)
+    new_canvas_requested = pyqtSignal(tuple)
 
     def __init__(self):
         super().__init__()
@@ -235,6 +513,47 @@ class ToolPanel(QWidget):
         control_group.setLayout(control_layout)
         layout.addWidget(control_group)
 
+        view_group = QGroupBox("View")
+        view_layout = QVBoxLayout()
+
+        self.zoom_label = QLabel("Zoom: 100%")
+        view_layout.addWidget(self.zoom_label)
+
+        zoom_layout = QHBoxLayout()
+        for text, action in [("-", "out"), ("+", "in"), ("Fit", "fit"), ("1:1", "reset")]:
+            zoom_btn = QPushButton(text)
+            zoom_btn.setFixedWidth(38)
+            zoom_btn.clicked.connect(
+                lambda checked, action=action: self.zoom_requested.emit(action))
+            zoom_layout.addWidget(zoom_btn)
+        view_layout.addLayout(zoom_layout)
+
+        size_layout = QHBoxLayout()
+        self.canvas_width = QSpinBox()
+        self.canvas_width.setRange(16, 16384)
+        self.canvas_width.setValue(1920)
+        self.canvas_height = QSpinBox()
+        self.canvas_height.setRange(16, 16384)
+        self.canvas_height.setValue(1080)
+        size_layout.addWidget(self.canvas_width)
+        size_layout.addWidget(QLabel("x"))
+        size_layout.addWidget(self.canvas_height)
+        view_layout.addLayout(size_layout)
+
+        self.low_memory_check = QCheckBox("Low memory mode")
+        view_layout.addWidget(self.low_memory_check)
+
+        new_canvas_btn = QPushButton("New canvas")
+        new_canvas_btn.clicked.connect(self.prepare_new_canvas)
+        view_layout.addWidget(new_canvas_btn)
+
+        self.memory_label = QLabel("Canvas in memory")
+        self.memory_label.setWordWrap(True)
+        view_layout.addWidget(self.memory_label)
+
+        view_group.setLayout(view_layout)
+        layout.addWidget(view_group)
+
         layout.addStretch()
 
         publish_group = QGroupBox("Publication")
@@ -252,6 +571,15 @@ class ToolPanel(QWidget):
         publish_btn.clicked.connect(self.prepare_publish)
         publish_layout.addWidget(publish_btn)
 
+        self.document_label = QLabel("New drawing")
+        self.document_label.setWordWrap(True)
+        publish_layout.addWidget(self.document_label)
+
+        self.revision_btn = QPushButton("Save as new revision")
+        self.revision_btn.setEnabled(False)
+        self.revision_btn.clicked.connect(self.revision_requested.emit)
+        publish_layout.addWidget(self.revision_btn)
+
         publish_group.setLayout(publish_layout)
         layout.addWidget(publish_group)
 
@@ -278,3 +606,31 @@ class ToolPanel(QWidget):
     def prepare_publish(self):
         self.publish_requested.emit(
             (self.artist_name.text(), self.art_name.text()))
+
+    def set_document(self, text):
+        self.document_label.setText(text or "New drawing")
+        self.revision_btn.setEnabled(bool(text))
+
+    def set_zoom(self, zoom):
+        self.zoom_label.setText(f"Zoom: {zoom * 100:.0f}%")
+
+    def prepare_new_canvas(self):
+        self.new_canvas_requested.emit(
+            (self.canvas_width.value(), self.canvas_height.value(),
+             self.low_memory_check.isChecked()))
+
+    def set_working_set(self, stats):
+        if not stats:
+            self.memory_label.setText("Canvas in memory")
+            return
+
+        megabyte = 1024 * 1024
+        self.memory_label.setText(
+            f"Tiles: {stats['resident_tiles']}/{stats['tiles']} resident\n"
+            f"RAM: {stats['resident_bytes'] / megabyte:.0f} MB "
+            f"(peak {stats['peak_resident_bytes'] / megabyte:.0f}, "
+            f"budget {stats['budget_bytes'] / megabyte:.0f})\n"
+            f"Preview cache: {stats['pyramid_bytes'] / megabyte:.0f} MB\n"
+            f"Spilled: {stats['spilled_bytes'] / megabyte:.0f} MB "
+            f"(pre-edit {stats['base_bytes'] / megabyte:.0f}, "
+            f"on disk {stats['scratch_bytes'] / megabyte:.0f})")
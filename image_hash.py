@@ -0,0 +1,186 @@
+from functools import lru_cache
+
+from PyQt6.QtCore import Qt, QRect, QSize
+from PyQt6.QtGui import QImage
+
+from image_io import read_preview
+
+HASH_BITS = 64
+CHUNK_BITS = 16
+CHUNKS = HASH_BITS // CHUNK_BITS
+DUPLICATE_DISTANCE = 4
+SIMILAR_DISTANCE = 12
+
+# Stored hashes carry the algorithm version, so older ones get recomputed
+HASH_PREFIX = "d3:"
+
+PREVIEW_SIZE = 256
+# Pictures are hashed from a copy no larger than this, never at full size
+SOURCE_SIZE = 1024
+CONTENT_THRESHOLD = 24
+MIN_CONTENT_PIXELS = 16
+
+
+def content_rect(image):
+    # Bounding box of everything that differs from the background, found on a small preview
+    preview = image
+    if max(image.width(), image.height()) > PREVIEW_SIZE:
+        preview = image.scaled(
+            PREVIEW_SIZE, PREVIEW_SIZE,
+            Qt.AspectRatioMode.KeepAspectRatio,
+            Qt.TransformationMode.SmoothTransformation
+        )
+    preview = preview.convertToFormat(QImage.Format.Format_Grayscale8)
+    width, height = preview.width(), preview.height()
+
+    bits = preview.constBits()
+    bits.setsize(preview.sizeInBytes())
+    data = bits.asstring()
+    stride = preview.bytesPerLine()
+
+    corners = sorted(data[y * stride + x] for x in (0, width - 1) for y in (0, height - 1))
+    background = corners[2]
+    marks = bytes(1 if abs(value - background) > CONTENT_THRESHOLD else 0 for value in range(256))
+
+    count = 0
+    left, top, right, bottom = width, height, -1, -1
+    for y in range(height):
+        row = data[y * stride:y * stride + width].translate(marks)
+        first = row.find(1)
+        if first < 0:
+            continue
+        count += row.count(1)
+        left = min(left, first)
+        right = max(right, row.rfind(1))
+        top = min(top, y)
+        bottom = y
+
+    # Blank and near-blank canvases have no shape to compare
+    if count < MIN_CONTENT_PIXELS:
+        return None
+
+    scale_x = image.width() / width
+    scale_y = image.height() / height
+    rect = QRect(int((left - 1) * scale_x), int((top - 1) * scale_y),
+                 int((right - left + 3) * scale_x), int((bottom - top + 3) * scale_y))
+    return rect.intersected(image.rect())
+
+
+def hash_source(image):
+    if max(image.width(), image.height()) <= SOURCE_SIZE:
+        return image
+    return image.scaled(
+        SOURCE_SIZE, SOURCE_SIZE,
+        Qt.AspectRatioMode.KeepAspectRatio,
+        Qt.TransformationMode.SmoothTransformation
+    )
+
+
+def decode_hash_source(pixmap_data):
+    # Decoded straight to the hash size, so large artworks never need a full-size image
+    return read_preview(pixmap_data, QSize(SOURCE_SIZE, SOURCE_SIZE))
+
+
+def dhash(image):
+    if image is None or image.isNull():
+        return None
+
+    image = hash_source(image)
+    rect = content_rect(image)
+    if rect is None or rect.isEmpty():
+        return None
+
+    # 9x8 gradient hash of the content: one bit per horizontally adjacent pixel pair
+    small = image.copy(rect).scaled(
+        9, 8,
+        Qt.AspectRatioMode.IgnoreAspectRatio,
+        Qt.TransformationMode.SmoothTransformation
+    ).convertToFormat(QImage.Format.Format_Grayscale8)
+    value = 0
+    for y in range(8):
+        for x in range(8):
+            left = small.pixel(x, y) & 0xFF
+            right = small.pixel(x + 1, y) & 0xFF
+            value = (value << 1) | (1 if left > right else 0)
+    return value
+
+
+def hash_image_data(pixmap_data):
+    if not pixmap_data:
+        return None
+    return dhash(decode_hash_source(pixmap_data))
+
+
+def hash_to_text(value):
+    # A bare prefix marks an artwork as processed but without a usable hash
+    if value is None:
+        return HASH_PREFIX
+    return f"{HASH_PREFIX}{value:016x}"
+
+
+def hash_from_text(text):
+    if not text or not text.startswith(HASH_PREFIX) or len(text) == len(HASH_PREFIX):
+        return None
+    try:
+        return int(text[len(HASH_PREFIX):], 16)
+    except ValueError:
+        return None
+
+
+def hamming_distance(a, b):
+    return (a ^ b).bit_count()
+
+
+def hash_chunks(key):
+    mask = (1 << CHUNK_BITS) - 1
+    return [(key >> (index * CHUNK_BITS)) & mask for index in range(CHUNKS)]
+
+
+@lru_cache(maxsize=None)
+def chunk_masks(radius):
+    return [mask for mask in range(1 << CHUNK_BITS) if mask.bit_count() <= radius]
+
+
+class MultiIndexHash:
+    def __init__(self):
+        self.tables = [{} for _ in range(CHUNKS)]
+        self.keys = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, key, item):
+        if item in self.keys:
+            self.remove(self.keys[item], item)
+        self.keys[item] = key
+        for table, chunk in zip(self.tables, hash_chunks(key)):
+            table.setdefault(chunk, set()).add(item)
+
+    def remove(self, key, item):
+        if self.keys.get(item) != key:
+            return False
+        del self.keys[item]
+        for table, chunk in zip(self.tables, hash_chunks(key)):
+            bucket = table[chunk]
+            bucket.discard(item)
+            if not bucket:
+                del table[chunk]
+        return True
+
+    def search(self, key, radius):
+        # Pigeonhole: within the radius, at least one chunk differs by radius // CHUNKS bits or less
+        masks = chunk_masks(min(radius // CHUNKS, CHUNK_BITS))
+        candidates = set()
+        for table, chunk in zip(self.tables, hash_chunks(key)):
+            for mask in masks:
+                bucket = table.get(chunk ^ mask)
+                if bucket:
+                    candidates.update(bucket)
+
+        results = []
+        for item in candidates:
+            distance = hamming_distance(key, self.keys[item])
+            if distance <= radius:
+                results.append((distance, item))
+        results.sort(key=lambda pair: pair[0])
+        return results
@@ -0,0 +1,158 @@
+import struct
+import zlib
+
+from PyQt6.QtCore import Qt, QBuffer, QByteArray, QIODevice, QSize
+from PyQt6.QtGui import QImage, QImageReader, QPainter
+
+# Qt refuses to decode images over 256 MB by default; the largest canvas
+# (16384x16384 ARGB32) needs 1 GB, so the limit is raised with some headroom
+IMAGE_ALLOCATION_LIMIT_MB = 2048
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# 8-bit RGB and RGBA, which is what Qt writes; bytes per pixel by colour type
+PNG_BYTES_PER_PIXEL = {2: 3, 6: 4}
+# Chunks that do not change pixel values, so bands decode exactly like the whole file
+PNG_SAFE_CHUNKS = {b"IHDR", b"IDAT", b"IEND", b"pHYs", b"tEXt", b"zTXt", b"iTXt", b"tIME"}
+DECOMPRESS_STEP = 1024 * 1024
+PREVIEW_BAND = 256
+
+
+def allow_large_images():
+    QImageReader.setAllocationLimit(IMAGE_ALLOCATION_LIMIT_MB)
+
+
+def image_bytes(data):
+    if isinstance(data, QByteArray):
+        return data.data()
+    return bytes(data) if data else b""
+
+
+def image_size(data):
+    # Reads only the header, the pixels stay compressed
+    buffer = QBuffer()
+    buffer.setData(QByteArray(image_bytes(data)))
+    buffer.open(QIODevice.OpenModeFlag.ReadOnly)
+    size = QImageReader(buffer).size()
+    buffer.close()
+    return size if size.isValid() else QSize()
+
+
+def png_chunks(data):
+    position = len(PNG_SIGNATURE)
+    while position + 8 <= len(data):
+        length, kind = struct.unpack(">I4s", data[position:position + 8])
+        yield kind, data[position + 8:position + 8 + length]
+        position += 12 + length
+
+
+def png_chunk(kind, payload):
+    return (struct.pack(">I", len(payload)) + kind + payload
+            + struct.pack(">I", zlib.crc32(kind + payload) & 0xFFFFFFFF))
+
+
+def png_band(width, rows, color_type, raw):
+    header = struct.pack(">IIBBBBB", width, rows, 8, color_type, 0, 0, 0)
+    return (PNG_SIGNATURE + png_chunk(b"IHDR", header)
+            + png_chunk(b"IDAT", zlib.compress(raw, 1)) + png_chunk(b"IEND", b""))
+
+
+def streamable_png(data):
+    if not data.startswith(PNG_SIGNATURE):
+        return None
+    header = None
+    for kind, payload in png_chunks(data):
+        if kind not in PNG_SAFE_CHUNKS:
+            return None
+        if kind == b"IHDR":
+            header = struct.unpack(">IIBBBBB", payload)
+    if header is None:
+        return None
+    width, height, depth, color_type, _, _, interlace = header
+    if depth != 8 or interlace != 0 or color_type not in PNG_BYTES_PER_PIXEL:
+        return None
+    return width, height, color_type
+
+
+def raw_scanlines(data):
+    decompressor = zlib.decompressobj()
+    for kind, payload in png_chunks(data):
+        if kind != b"IDAT":
+            continue
+        chunk = decompressor.decompress(payload, DECOMPRESS_STEP)
+        yield chunk
+        while decompressor.unconsumed_tail:
+            yield decompressor.decompress(decompressor.unconsumed_tail, DECOMPRESS_STEP)
+    yield decompressor.flush()
+
+
+def last_row_bytes(image, color_type, width):
+    # The row a band's filters refer to, stored unfiltered in PNG sample order
+    target = QImage.Format.Format_RGBA8888 if color_type == 6 else QImage.Format.Format_RGB888
+    row = image.copy(0, image.height() - 1, width, 1).convertToFormat(target)
+    bits = row.constBits()
+    bits.setsize(row.sizeInBytes())
+    return b"\x00" + bits.asstring()[:width * PNG_BYTES_PER_PIXEL[color_type]]
+
+
+def read_bands(data, band_height):
+    # Yields (y, image) strips, so a huge PNG never has to be decoded in one piece.
+    # Each strip is re-wrapped as a small PNG, with the row above it as an
+    # unfiltered first row so the strip's own filters decode correctly.
+    data = image_bytes(data)
+    layout = streamable_png(data)
+    if layout is None:
+        image = QImage.fromData(data)
+        if not image.isNull():
+            yield 0, image
+        return
+
+    width, height, color_type = layout
+    row_bytes = 1 + width * PNG_BYTES_PER_PIXEL[color_type]
+    pending = bytearray()
+    previous = None
+    y = 0
+    for chunk in raw_scanlines(data):
+        pending += chunk
+        while y < height and (len(pending) >= band_height * row_bytes
+                              or len(pending) >= (height - y) * row_bytes):
+            rows = min(band_height, height - y)
+            raw = bytes(pending[:rows * row_bytes])
+            del pending[:rows * row_bytes]
+
+            if previous is None:
+                band = QImage.fromData(png_band(width, rows, color_type, raw), "PNG")
+            else:
+                band = QImage.fromData(png_band(width, rows + 1, color_type, previous + raw), "PNG")
+                band = band.copy(0, 1, width, rows)
+            if band.isNull():
+                return
+            previous = last_row_bytes(band, color_type, width)
+            yield y, band
+            y += rows
+
+
+def read_preview(data, size):
+    # Downscaled strip by strip, so a preview of a huge picture costs only its own pixels
+    full = image_size(data)
+    if not full.isValid():
+        return QImage()
+    target = full.scaled(size, Qt.AspectRatioMode.KeepAspectRatio)
+    if target.isEmpty() or target.width() >= full.width():
+        return QImage.fromData(image_bytes(data))
+
+    preview = QImage(target, QImage.Format.Format_ARGB32_Premultiplied)
+    preview.fill(Qt.GlobalColor.transparent)
+    scale = target.height() / full.height()
+    painter = QPainter(preview)
+    for y, band in read_bands(data, PREVIEW_BAND):
+        top = round(y * scale)
+        bottom = round((y + band.height()) * scale)
+        if bottom <= top:
+            continue
+        painter.drawImage(0, top, band.scaled(
+            target.width(), bottom - top,
+            Qt.AspectRatioMode.IgnoreAspectRatio,
+            Qt.TransformationMode.SmoothTransformation
+        ))
+    painter.end()
+    return preview
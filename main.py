@@ -1,6 +1,8 @@
 from PyQt6.QtWidgets import *
 import sys
+import multiprocessing
 from tabs import DrawingTab, GalleryTab
+from image_io import allow_large_images
 
 
 class ArtStudio(QWidget):
@@ -23,16 +25,38 @@ class ArtStudio(QWidget):
         self.drawing_tab.drawing_area.publishRequest.connect(
             self.gallery_tab.database_widget.publish_art
         )
+        self.drawing_tab.drawing_area.revisionRequest.connect(
+            self.gallery_tab.database_widget.save_revision
+        )
+        self.gallery_tab.database_widget.revisionSaved.connect(
+            self.drawing_tab.drawing_area.on_revision_saved
+        )
+        self.gallery_tab.database_widget.openRequest.connect(self.open_artwork)
+
+    def open_artwork(self, args):
+        # The gallery stays in front if the current drawing is kept
+        if self.drawing_tab.drawing_area.open_artwork(args):
+            self.tab_widget.setCurrentWidget(self.drawing_tab)
 
     def save_drawing(self):
         filename, _ = QFileDialog.getSaveFileName(
-            self, "save art", "art.png", "Арт (*.png, *.jpg, *.svg)"
+            self, "save art", "art.png", "Арт (*.png *.jpg *.svg)"
         )
-        if filename:
-            self.drawing_tab.drawing_area.pixmap.save(filename)
+        if not filename:
+            return
+        if filename.lower().endswith(".svg"):
+            self.drawing_tab.drawing_area.export_svg(filename)
+        else:
+            self.drawing_tab.drawing_area.canvas_image().save(filename)
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    if len(sys.argv) > 1 and sys.argv[1] == "export":
+        from batch_export import main as export_main
+        sys.exit(export_main(sys.argv[2:]))
+
+    allow_large_images()
     app = QApplication(sys.argv)
     window = ArtStudio()
     window.show()
@@ -0,0 +1,155 @@
+import math
+
+from PyQt6.QtCore import Qt, QRect
+from PyQt6.QtGui import QImage, QPainter
+
+CHUNK_SIZE = 256
+MIN_LEVEL_SIZE = 32
+MAX_DIRTY_RECTS = 16
+
+
+def scale_rect_down(rect, level):
+    factor = 1 << level
+    left = rect.left() // factor
+    top = rect.top() // factor
+    right = -(-(rect.right() + 1) // factor)
+    bottom = -(-(rect.bottom() + 1) // factor)
+    return QRect(left, top, right - left, bottom - top)
+
+
+def scale_rect_up(rect, level):
+    factor = 1 << level
+    return QRect(rect.left() * factor, rect.top() * factor,
+                 rect.width() * factor, rect.height() * factor)
+
+
+def rect_area(rect):
+    return rect.width() * rect.height()
+
+
+def merge_cheapest(rects):
+    # Joins the pair of rects whose union adds the fewest pixels
+    best = None
+    for i in range(len(rects)):
+        for j in range(i + 1, len(rects)):
+            united = rects[i].united(rects[j])
+            cost = rect_area(united) - rect_area(rects[i]) - rect_area(rects[j])
+            if best is None or cost < best[0]:
+                best = (cost, i, j, united)
+    _, i, j, united = best
+    return [rect for index, rect in enumerate(rects) if index not in (i, j)] + [united]
+
+
+class MipPyramid:
+    def __init__(self, source, width, height, memory_budget=None):
+        self.source = source
+        self.resize(width, height, memory_budget)
+
+    def resize(self, width, height, memory_budget=None):
+        self.width = width
+        self.height = height
+        self.levels = {}
+        self.dirty = {}
+        self.max_level = 0
+        while max(width, height) >> (self.max_level + 1) >= MIN_LEVEL_SIZE:
+            self.max_level += 1
+
+        # With a budget, the finest levels are dropped until all cached levels fit in it together
+        self.min_level = 1
+        if memory_budget is not None:
+            while (self.min_level < self.max_level
+                   and self.cached_bytes(self.min_level) > memory_budget):
+                self.min_level += 1
+
+    def level_bytes(self, level):
+        width, height = self.level_size(level)
+        return width * height * 4
+
+    def cached_bytes(self, min_level):
+        return sum(self.level_bytes(level) for level in range(min_level, self.max_level + 1))
+
+    def memory_bytes(self):
+        return sum(image.sizeInBytes() for image in self.levels.values())
+
+    def level_size(self, level):
+        factor = 1 << level
+        return -(-self.width // factor), -(-self.height // factor)
+
+    def level_for_zoom(self, zoom):
+        if zoom >= 0.5 or self.max_level == 0:
+            return 0
+        level = min(int(math.floor(math.log2(1 / zoom))), self.max_level)
+        return max(level, self.min_level)
+
+    def invalidate(self, rect):
+        if rect.isEmpty():
+            return
+        for level in self.levels:
+            self.add_dirty(level, scale_rect_down(rect, level))
+
+    def add_dirty(self, level, rect):
+        # Rects are merged only when the union covers no extra pixels, so a
+        # diagonal or outline stroke does not dirty its whole bounding box
+        merged = rect
+        pending = []
+        for dirty_rect in self.dirty[level]:
+            united = merged.united(dirty_rect)
+            if (dirty_rect.intersects(merged.adjusted(-1, -1, 1, 1))
+                    and rect_area(united) <= rect_area(merged) + rect_area(dirty_rect)):
+                merged = united
+            else:
+                pending.append(dirty_rect)
+        pending.append(merged)
+
+        while len(pending) > MAX_DIRTY_RECTS:
+            pending = merge_cheapest(pending)
+        self.dirty[level] = pending
+
+    def image(self, level):
+        if level not in self.levels:
+            width, height = self.level_size(level)
+            self.levels[level] = QImage(width, height, QImage.Format.Format_ARGB32_Premultiplied)
+            self.dirty[level] = [QRect(0, 0, width, height)]
+
+        if self.dirty[level]:
+            self.rebuild(level)
+        return self.levels[level]
+
+    def rebuild(self, level):
+        image = self.levels[level]
+        region = [rect.intersected(image.rect()) for rect in self.dirty[level]]
+        self.dirty[level] = []
+
+        # Each level is built from the next finer cached level when there is one
+        finer = None
+        if level - 1 >= self.min_level:
+            finer = self.image(level - 1)
+
+        painter = QPainter(image)
+        painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_Source)
+        for rect in region:
+            if rect.isEmpty():
+                continue
+            for chunk in self.chunks(rect):
+                if finer is not None:
+                    source_rect = scale_rect_up(chunk, 1).intersected(finer.rect())
+                    block = finer.copy(source_rect)
+                else:
+                    source_rect = scale_rect_up(chunk, level).intersected(
+                        QRect(0, 0, self.width, self.height))
+                    block = self.source(source_rect)
+
+                block = block.scaled(
+                    chunk.width(), chunk.height(),
+                    Qt.AspectRatioMode.IgnoreAspectRatio,
+                    Qt.TransformationMode.SmoothTransformation
+                )
+                painter.drawImage(chunk.topLeft(), block)
+        painter.end()
+
+    def chunks(self, rect):
+        for top in range(rect.top(), rect.bottom() + 1, CHUNK_SIZE):
+            for left in range(rect.left(), rect.right() + 1, CHUNK_SIZE):
+                yield QRect(left, top,
+                            min(CHUNK_SIZE, rect.right() + 1 - left),
+                            min(CHUNK_SIZE, rect.bottom() + 1 - top))
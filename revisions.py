@@ -0,0 +1,138 @@
+from PyQt6.QtCore import Qt, QRect, QRectF, QByteArray, QDataStream, QIODevice
+from PyQt6.QtGui import QImage, QPainter
+
+TILE_SIZE = 64
+IMAGE_FORMAT = QImage.Format.Format_ARGB32
+
+
+def normalize_image(image):
+    if image.format() == IMAGE_FORMAT:
+        return image
+    return image.convertToFormat(IMAGE_FORMAT)
+
+
+def blank_image(width, height):
+    image = QImage(width, height, IMAGE_FORMAT)
+    image.fill(Qt.GlobalColor.white)
+    return image
+
+
+def tile_rect(key):
+    tx, ty = key
+    return QRect(tx * TILE_SIZE, ty * TILE_SIZE, TILE_SIZE, TILE_SIZE)
+
+
+def tiles_in_rect(rect, width, height):
+    rect = rect.normalized().intersected(QRect(0, 0, width, height))
+    if rect.isEmpty():
+        return set()
+    return {
+        (tx, ty)
+        for ty in range(rect.top() // TILE_SIZE, rect.bottom() // TILE_SIZE + 1)
+        for tx in range(rect.left() // TILE_SIZE, rect.right() // TILE_SIZE + 1)
+    }
+
+
+def cells_in_path(path, cell_size, width, height):
+    bounds = path.boundingRect().toAlignedRect().intersected(QRect(0, 0, width, height))
+    if bounds.isEmpty():
+        return set()
+
+    # Quadtree descent, so only cells the path really covers are tested one by one
+    cells = set()
+    stack = [(bounds.left() // cell_size, bounds.top() // cell_size,
+              bounds.right() // cell_size, bounds.bottom() // cell_size)]
+    while stack:
+        left, top, right, bottom = stack.pop()
+        area = QRectF(left * cell_size, top * cell_size,
+                      (right - left + 1) * cell_size, (bottom - top + 1) * cell_size)
+        if not path.intersects(area):
+            continue
+        if left == right and top == bottom:
+            cells.add((left, top))
+        elif right - left >= bottom - top:
+            middle = (left + right) // 2
+            stack.append((left, top, middle, bottom))
+            stack.append((middle + 1, top, right, bottom))
+        else:
+            middle = (top + bottom) // 2
+            stack.append((left, top, right, middle))
+            stack.append((left, middle + 1, right, bottom))
+    return cells
+
+
+def tiles_in_path(path, width, height):
+    return cells_in_path(path, TILE_SIZE, width, height)
+
+
+def all_tiles(width, height):
+    return tiles_in_rect(QRect(0, 0, width, height), width, height)
+
+
+def diff_tiles(image, parent, damaged):
+    image = normalize_image(image)
+    if parent is None or parent.size() != image.size():
+        return diff_regions(image.copy, None, all_tiles(image.width(), image.height()),
+                            image.width(), image.height())
+    parent = normalize_image(parent)
+    return diff_regions(image.copy, parent.copy, damaged, image.width(), image.height())
+
+
+def diff_regions(source, parent, damaged, width, height):
+    # source and parent map a rect to its pixels, so neither picture has to be whole in memory
+    tiles = {}
+    bounds = QRect(0, 0, width, height)
+    for key in damaged:
+        rect = tile_rect(key).intersected(bounds)
+        if rect.isEmpty():
+            continue
+        tile = normalize_image(source(rect))
+        # Damage is conservative, so tiles that ended up unchanged are dropped
+        if parent is not None and tile == normalize_image(parent(rect)):
+            continue
+        tiles[key] = tile
+    return tiles
+
+
+def encode_tiles(tiles):
+    data = QByteArray()
+    stream = QDataStream(data, QIODevice.OpenModeFlag.WriteOnly)
+    stream.writeInt32(len(tiles))
+    for (tx, ty), tile in sorted(tiles.items()):
+        stream.writeInt32(tx)
+        stream.writeInt32(ty)
+        stream << tile
+    return data
+
+
+def decode_tiles(data):
+    tiles = {}
+    if not data:
+        return tiles
+    stream = QDataStream(QByteArray(data))
+    for _ in range(stream.readInt32()):
+        tx = stream.readInt32()
+        ty = stream.readInt32()
+        tile = QImage()
+        stream >> tile
+        tiles[(tx, ty)] = tile
+    return tiles
+
+
+def apply_tiles(image, tiles):
+    painter = QPainter(image)
+    painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_Source)
+    for key, tile in tiles.items():
+        painter.drawImage(tile_rect(key).topLeft(), tile)
+    painter.end()
+    return image
+
+
+def resize_image(image, width, height):
+    if image.width() == width and image.height() == height:
+        return image
+    resized = blank_image(width, height)
+    painter = QPainter(resized)
+    painter.drawImage(0, 0, image)
+    painter.end()
+    return resized
@@ -25,6 +25,22 @@ class DrawingTab(QWidget):
         self.tool_panel.publish_requested.connect(
             self.drawing_area.publish_art
         )
+        self.tool_panel.revision_requested.connect(
+            self.drawing_area.save_revision
+        )
+        self.drawing_area.documentChanged.connect(
+            self.tool_panel.set_document
+        )
+        self.tool_panel.zoom_requested.connect(
+            self.drawing_area.apply_zoom_action
+        )
+        self.tool_panel.new_canvas_requested.connect(
+            self.drawing_area.new_canvas
+        )
+        self.drawing_area.zoomChanged.connect(self.tool_panel.set_zoom)
+        self.drawing_area.workingSetChanged.connect(
+            self.tool_panel.set_working_set
+        )
 
 
 class GalleryTab(QWidget):
@@ -0,0 +1,244 @@
+import tempfile
+from collections import OrderedDict
+
+from PyQt6.QtCore import Qt, QRect
+from PyQt6.QtGui import QImage, QPainter
+from image_io import read_bands
+from revisions import cells_in_path
+
+TILE_SIZE = 256
+TILE_FORMAT = QImage.Format.Format_ARGB32_Premultiplied
+DEFAULT_BUDGET = 128 * 1024 * 1024
+MIN_RESIDENT_TILES = 16
+PREFETCH_RING = 1
+
+
+class TileStore:
+    def __init__(self, width, height, budget=DEFAULT_BUDGET, directory=None):
+        self.width = width
+        self.height = height
+        self.columns = -(-width // TILE_SIZE)
+        self.rows = -(-height // TILE_SIZE)
+        self.tile_bytes = TILE_SIZE * TILE_SIZE * 4
+        self.capacity = max(MIN_RESIDENT_TILES, budget // self.tile_bytes)
+
+        # The scratch file only grows by a slot per tile actually written, so its size
+        # follows what was spilled rather than the canvas size on any filesystem.
+        # Base slots keep the pre-edit copy of tiles changed since the last checkpoint.
+        self.scratch = tempfile.TemporaryFile(dir=directory)
+        self.scratch_size = 0
+        self.slots = {}
+        self.base_slots = {}
+
+        self.resident = OrderedDict()
+        self.dirty = set()
+        self.spilled = set()
+        self.touched = set()
+        self.hits = 0
+        self.misses = 0
+        self.page_ins = 0
+        self.evictions = 0
+        self.write_backs = 0
+        self.peak_resident = 0
+
+    def close(self):
+        self.resident.clear()
+        self.scratch.close()
+
+    def rect(self):
+        return QRect(0, 0, self.width, self.height)
+
+    @staticmethod
+    def tile_origin(key):
+        return key[0] * TILE_SIZE, key[1] * TILE_SIZE
+
+    def keys_in_rect(self, rect):
+        rect = rect.intersected(self.rect())
+        if rect.isEmpty():
+            return []
+        return [
+            (tx, ty)
+            for ty in range(rect.top() // TILE_SIZE, rect.bottom() // TILE_SIZE + 1)
+            for tx in range(rect.left() // TILE_SIZE, rect.right() // TILE_SIZE + 1)
+        ]
+
+    def keys_in_path(self, path):
+        return cells_in_path(path, TILE_SIZE, self.width, self.height)
+
+    def slot(self, slots, key):
+        # Slots are kept for reuse, so a tile written again overwrites its old copy
+        start = slots.get(key)
+        if start is None:
+            start = slots[key] = self.scratch_size
+            self.scratch_size += self.tile_bytes
+        return start
+
+    def tile(self, key):
+        image = self.resident.get(key)
+        if image is not None:
+            self.resident.move_to_end(key)
+            self.hits += 1
+            return image
+
+        self.misses += 1
+        image = self.page_in(key)
+        self.resident[key] = image
+        self.evict()
+        self.peak_resident = max(self.peak_resident, len(self.resident))
+        return image
+
+    def peek(self, key):
+        # Read-only access that leaves the resident set alone; None means a blank tile
+        image = self.resident.get(key)
+        if image is None and key in self.spilled:
+            image = self.page_in(key)
+        return image
+
+    def page_in(self, key):
+        if key not in self.spilled:
+            image = QImage(TILE_SIZE, TILE_SIZE, TILE_FORMAT)
+            image.fill(Qt.GlobalColor.white)
+            return image
+
+        self.page_ins += 1
+        return self.read_tile(self.slots[key])
+
+    def read_tile(self, start):
+        self.scratch.seek(start)
+        data = self.scratch.read(self.tile_bytes)
+        return QImage(data, TILE_SIZE, TILE_SIZE, TILE_SIZE * 4, TILE_FORMAT).copy()
+
+    def write_tile(self, start, image):
+        bits = image.constBits()
+        bits.setsize(self.tile_bytes)
+        self.scratch.seek(start)
+        self.scratch.write(bits.asstring())
+
+    def evict(self):
+        while len(self.resident) > self.capacity:
+            key, image = self.resident.popitem(last=False)
+            self.evictions += 1
+            if key in self.dirty:
+                self.write_back(key, image)
+
+    def write_back(self, key, image):
+        self.write_tile(self.slot(self.slots, key), image)
+        self.spilled.add(key)
+        self.dirty.discard(key)
+        self.write_backs += 1
+
+    def mark_dirty(self, key):
+        self.dirty.add(key)
+
+    def preserve(self, key, image):
+        # Copy-on-write: the first edit after a checkpoint saves the tile it replaces
+        if key in self.touched:
+            return
+        self.write_tile(self.slot(self.base_slots, key), image)
+        self.touched.add(key)
+
+    def base_tile(self, key):
+        if key in self.touched:
+            return self.read_tile(self.base_slots[key])
+        return self.peek(key)
+
+    def checkpoint(self):
+        self.touched.clear()
+
+    def prefetch(self, rect):
+        visible = self.keys_in_rect(rect)
+        budget = self.capacity - len(visible)
+        if budget <= 0:
+            return
+
+        # Touch the ring around the viewport first so visible tiles stay most recent
+        ring_rect = rect.adjusted(-TILE_SIZE * PREFETCH_RING, -TILE_SIZE * PREFETCH_RING,
+                                  TILE_SIZE * PREFETCH_RING, TILE_SIZE * PREFETCH_RING)
+        visible_keys = set(visible)
+        ring = [key for key in self.keys_in_rect(ring_rect) if key not in visible_keys]
+        for key in ring[:budget]:
+            if key not in self.resident:
+                self.tile(key)
+        for key in visible:
+            self.tile(key)
+
+    def paint(self, path, draw):
+        # Only tiles under the painted area are paged in and marked dirty
+        for key in self.keys_in_path(path):
+            x, y = self.tile_origin(key)
+            image = self.tile(key)
+            self.preserve(key, image)
+            painter = QPainter(image)
+            painter.translate(-x, -y)
+            draw(painter)
+            painter.end()
+            self.mark_dirty(key)
+
+    def draw_region(self, painter, rect):
+        for key in self.keys_in_rect(rect):
+            x, y = self.tile_origin(key)
+            painter.drawImage(x, y, self.tile(key))
+
+    def region(self, rect, lookup=None):
+        lookup = lookup or self.peek
+        rect = rect.intersected(self.rect())
+        image = QImage(rect.size(), TILE_FORMAT)
+        image.fill(Qt.GlobalColor.white)
+        painter = QPainter(image)
+        painter.translate(-rect.x(), -rect.y())
+        for key in self.keys_in_rect(rect):
+            tile = lookup(key)
+            if tile is not None:
+                x, y = self.tile_origin(key)
+                painter.drawImage(x, y, tile)
+        painter.end()
+        return image
+
+    def base_region(self, rect):
+        return self.region(rect, self.base_tile)
+
+    def to_image(self):
+        return self.region(self.rect())
+
+    def load_image(self, image, x=0, y=0):
+        bounds = QRect(x, y, image.width(), image.height()).intersected(self.rect())
+        for key in self.keys_in_rect(bounds):
+            tx, ty = self.tile_origin(key)
+            area = QRect(tx, ty, TILE_SIZE, TILE_SIZE).intersected(bounds)
+            painter = QPainter(self.tile(key))
+            painter.drawImage(area.x() - tx, area.y() - ty, image,
+                              area.x() - x, area.y() - y, area.width(), area.height())
+            painter.end()
+            self.mark_dirty(key)
+
+    def load_data(self, data):
+        # Encoded images are decoded one row of tiles at a time
+        loaded = False
+        for y, band in read_bands(data, TILE_SIZE):
+            self.load_image(band, 0, y)
+            loaded = True
+        return loaded
+
+    def clear(self):
+        for key in set(self.resident) | self.spilled:
+            self.preserve(key, self.peek(key))
+        self.resident.clear()
+        self.dirty.clear()
+        self.spilled.clear()
+
+    def stats(self):
+        return {
+            "tiles": self.columns * self.rows,
+            "resident_tiles": len(self.resident),
+            "resident_bytes": len(self.resident) * self.tile_bytes,
+            "budget_bytes": self.capacity * self.tile_bytes,
+            "peak_resident_bytes": self.peak_resident * self.tile_bytes,
+            "spilled_bytes": len(self.spilled) * self.tile_bytes,
+            "base_bytes": len(self.touched) * self.tile_bytes,
+            "scratch_bytes": self.scratch_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "page_ins": self.page_ins,
+            "evictions": self.evictions,
+            "write_backs": self.write_backs,
+        }
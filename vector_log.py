@@ -0,0 +1,215 @@
+import json
+import zlib
+
+from PyQt6.QtCore import Qt, QByteArray, QPoint, QPointF, QRect, QRectF, QSize
+from PyQt6.QtGui import (QColor, QImage, QPainter, QPainterPath, QPainterPathStroker, QPen,
+                         QPolygon)
+from PyQt6.QtSvg import QSvgGenerator
+
+LOG_VERSION = 1
+SIMPLIFY_TOLERANCE = 0.5
+SHAPE_TOOLS = ("line", "rectangle", "ellipse")
+
+
+def make_pen(tool, color, width):
+    if tool == "eraser":
+        return QPen(QColor(Qt.GlobalColor.white), width * 2,
+                    Qt.PenStyle.SolidLine, Qt.PenCapStyle.RoundCap,
+                    Qt.PenJoinStyle.RoundJoin)
+    return QPen(QColor(color), width,
+                Qt.PenStyle.SolidLine, Qt.PenCapStyle.RoundCap,
+                Qt.PenJoinStyle.RoundJoin)
+
+
+def stroke_outline(path, pen, margin=1):
+    # The area a stroke actually paints, widened a little for antialiasing
+    stroker = QPainterPathStroker(pen)
+    stroker.setWidth(pen.widthF() + margin * 2)
+    outline = stroker.createStroke(path)
+    if outline.isEmpty():
+        # Zero-length strokes still leave a round dot
+        radius = pen.widthF() / 2 + margin
+        outline.addEllipse(path.boundingRect().center(), radius, radius)
+    return outline
+
+
+def segment_distance(point, start, end):
+    px, py = point
+    sx, sy = start
+    ex, ey = end
+    dx, dy = ex - sx, ey - sy
+    length = dx * dx + dy * dy
+    if length == 0:
+        return ((px - sx) ** 2 + (py - sy) ** 2) ** 0.5
+    t = max(0.0, min(1.0, ((px - sx) * dx + (py - sy) * dy) / length))
+    cx, cy = sx + t * dx, sy + t * dy
+    return ((px - cx) ** 2 + (py - cy) ** 2) ** 0.5
+
+
+def simplify_points(points, tolerance=SIMPLIFY_TOLERANCE):
+    # Ramer-Douglas-Peucker, iterative so long strokes cannot hit the recursion limit
+    deduped = []
+    for point in points:
+        if not deduped or deduped[-1] != point:
+            deduped.append(point)
+    if len(deduped) < 3:
+        return deduped
+
+    keep = [False] * len(deduped)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(deduped) - 1)]
+    while stack:
+        first, last = stack.pop()
+        max_distance = 0.0
+        index = first
+        for i in range(first + 1, last):
+            distance = segment_distance(deduped[i], deduped[first], deduped[last])
+            if distance > max_distance:
+                max_distance = distance
+                index = i
+        if max_distance > tolerance:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+
+    return [point for point, kept in zip(deduped, keep) if kept]
+
+
+class StrokeCommand:
+    __slots__ = ("tool", "color", "width", "points")
+
+    def __init__(self, tool, color, width, points=None):
+        self.tool = tool
+        self.color = color
+        self.width = width
+        self.points = points if points is not None else []
+
+    def simplify(self, tolerance=SIMPLIFY_TOLERANCE):
+        if self.tool in SHAPE_TOOLS:
+            self.points = [self.points[0], self.points[-1]]
+        else:
+            self.points = simplify_points(self.points, tolerance)
+
+    def path(self):
+        path = QPainterPath()
+        if not self.points:
+            return path
+
+        if self.tool in SHAPE_TOOLS:
+            start, end = QPoint(*self.points[0]), QPoint(*self.points[-1])
+            if self.tool == "line":
+                path.moveTo(QPointF(start))
+                path.lineTo(QPointF(end))
+            elif self.tool == "rectangle":
+                path.addRect(QRectF(QRect(start, end).normalized()))
+            elif self.tool == "ellipse":
+                path.addEllipse(QRectF(QRect(start, end).normalized()))
+        else:
+            path.moveTo(*self.points[0])
+            for x, y in self.points[1:]:
+                path.lineTo(x, y)
+            if len(self.points) == 1:
+                path.lineTo(*self.points[0])
+        return path
+
+    def draw(self, painter):
+        if not self.points:
+            return
+        painter.setPen(make_pen(self.tool, self.color, self.width))
+
+        if self.tool in SHAPE_TOOLS:
+            start, end = QPoint(*self.points[0]), QPoint(*self.points[-1])
+            if self.tool == "line":
+                painter.drawLine(start, end)
+            elif self.tool == "rectangle":
+                painter.drawRect(QRect(start, end).normalized())
+            elif self.tool == "ellipse":
+                painter.drawEllipse(QRect(start, end).normalized())
+        elif len(self.points) == 1:
+            painter.drawPoint(QPoint(*self.points[0]))
+        else:
+            painter.drawPolyline(QPolygon([QPoint(x, y) for x, y in self.points]))
+
+    def to_list(self):
+        flat = [coordinate for point in self.points for coordinate in point]
+        return [self.tool, self.color, self.width, flat]
+
+    @classmethod
+    def from_list(cls, data):
+        tool, color, width, flat = data
+        points = list(zip(flat[0::2], flat[1::2]))
+        return cls(tool, color, width, points)
+
+
+class StrokeLog:
+    def __init__(self, width, height, base=False):
+        self.width = width
+        self.height = height
+        self.base = base
+        self.commands = []
+
+    def add(self, command):
+        self.commands.append(command)
+
+    def resize(self, width, height):
+        self.width = width
+        self.height = height
+
+    def replay(self, painter):
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        for command in self.commands:
+            command.draw(painter)
+
+    def render(self, width=None, height=None, base_image=None):
+        width = width or self.width
+        height = height or self.height
+        image = QImage(width, height, QImage.Format.Format_ARGB32)
+        painter = QPainter(image)
+        self.paint(painter, width, height, base_image)
+        painter.end()
+        return image
+
+    def paint(self, painter, width, height, base_image=None):
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+        painter.fillRect(QRectF(0, 0, width, height), QColor(Qt.GlobalColor.white))
+        painter.scale(width / self.width, height / self.height)
+        if base_image is not None:
+            painter.drawImage(0, 0, base_image)
+        self.replay(painter)
+
+    def export_svg(self, filename, base_image=None, title=""):
+        generator = QSvgGenerator()
+        generator.setFileName(filename)
+        generator.setSize(QSize(self.width, self.height))
+        generator.setViewBox(QRect(0, 0, self.width, self.height))
+        generator.setTitle(title)
+
+        painter = QPainter(generator)
+        self.paint(painter, self.width, self.height, base_image)
+        return painter.end()
+
+    def to_bytes(self):
+        data = {
+            "version": LOG_VERSION,
+            "width": self.width,
+            "height": self.height,
+            "commands": [command.to_list() for command in self.commands],
+        }
+        return zlib.compress(json.dumps(data, separators=(",", ":")).encode("utf-8"))
+
+    @classmethod
+    def from_bytes(cls, data):
+        if isinstance(data, QByteArray):
+            data = data.data()
+        if not data:
+            return None
+        try:
+            decoded = json.loads(zlib.decompress(data).decode("utf-8"))
+        except (zlib.error, ValueError):
+            return None
+        if decoded.get("version") != LOG_VERSION:
+            return None
+
+        log = cls(decoded["width"], decoded["height"])
+        log.commands = [StrokeCommand.from_list(item) for item in decoded["commands"]]
+        return log